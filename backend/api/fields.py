@@ -0,0 +1,103 @@
+import base64
+import binascii
+import logging
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+BASE64_HEADER = ';base64,'
+WHITESPACE = str.maketrans('', '', ' \t\r\n')
+
+
+class RecipeImageField(Base64ImageField):
+    """Изображение рецепта: файл из multipart или строка base64.
+
+    Base64 декодируется порциями во временный файл на диске, размер
+    проверяется до декодирования, поэтому в памяти не появляется
+    ещё одна полная копия изображения.
+    """
+    CHUNK_SIZE = 64 * 1024
+    TOO_LARGE_MESSAGE = 'Размер изображения не должен превышать {} МБ'
+
+    def to_internal_value(self, data):
+        if not settings.RECIPE_IMAGE_TRACE_MEMORY:
+            return self._to_internal_value(data)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            return self._to_internal_value(data)
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            if not tracing:
+                tracemalloc.stop()
+            logger.info(
+                'Загрузка изображения: пик памяти %d КБ', peak // 1024
+            )
+
+    def _to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if isinstance(data, UploadedFile):
+            self.check_size(data.size)
+        elif isinstance(data, str):
+            data = self.decode_to_file(data)
+        else:
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        # Проверку Pillow выполняет ImageField, минуя base64-логику
+        return serializers.ImageField.to_internal_value(self, data)
+
+    def check_size(self, size):
+        limit = settings.RECIPE_IMAGE_MAX_SIZE
+        if size > limit:
+            raise serializers.ValidationError(
+                self.TOO_LARGE_MESSAGE.format(limit // (1024 * 1024))
+            )
+
+    def decode_to_file(self, data):
+        start = data.find(BASE64_HEADER)
+        start = 0 if start == -1 else start + len(BASE64_HEADER)
+        self.check_size((len(data) - start) * 3 // 4)
+        upload = TemporaryUploadedFile(
+            name='upload', content_type=None, size=0, charset=None
+        )
+        try:
+            carry = ''
+            for position in range(start, len(data), self.CHUNK_SIZE):
+                chunk = carry + data[
+                    position:position + self.CHUNK_SIZE
+                ].translate(WHITESPACE)
+                aligned = len(chunk) // 4 * 4
+                upload.write(base64.b64decode(chunk[:aligned]))
+                carry = chunk[aligned:]
+            if carry:
+                raise binascii.Error
+        except (TypeError, binascii.Error, ValueError):
+            upload.close()
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        upload.size = upload.tell()
+        upload.seek(0)
+        extension = self.get_extension(upload)
+        if extension not in self.ALLOWED_TYPES:
+            upload.close()
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        upload.name = f'{uuid.uuid4()}.{extension}'
+        return upload
+
+    def get_extension(self, upload):
+        try:
+            with Image.open(upload) as image:
+                extension = image.format.lower()
+        except (OSError, AttributeError):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            upload.seek(0)
+        return 'jpg' if extension == 'jpeg' else extension
@@ -1,32 +1,109 @@
-from rest_framework import filters
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
-from recipe.models import Recipe
+from recipe.models import Basket, Favorite, Recipe
+from recipe.search import search as search_recipes
+
+from .tag_registry import tag_registry
+
+POPULAR_ORDERING = ('-favorites_count', '-pub_date', '-id')
+SEARCH_ORDERING = ('-search_rank', '-id')
+ORDERING_CHOICES = (
+    ('popular', 'По популярности'),
+)
+
 
 class IngredientSearchFilter(SearchFilter):
     search_param = 'name'
 
 
+class ValueListField(forms.Field):
+    """Повторяющийся GET-параметр без списка допустимых значений"""
+    widget = forms.MultipleHiddenInput
+
+    def __init__(self, *args, coerce=str, **kwargs):
+        self.coerce = coerce
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return [self.coerce(item) for item in value]
+        except (TypeError, ValueError):
+            raise forms.ValidationError(
+                'Некорректное значение', code='invalid'
+            )
+
+
+class ValueListFilter(filters.Filter):
+    field_class = ValueListField
+
+
+class TagsFilter(ValueListFilter):
+    """Рецепты хотя бы с одним из тэгов.
+
+    Slug переводятся в id по реестру тэгов, отбор идёт через EXISTS,
+    поэтому строки не дублируются и DISTINCT не нужен.
+    """
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        tag_ids = tag_registry.ids_for_slugs(value)
+        if not tag_ids:
+            return qs.none()
+        return qs.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=tag_ids
+        )))
+
+
 class RecipeFilter(FilterSet):
-    author = filters.AllValuesMultipleFilter(
-        field_name='author__id',
+    author = ValueListFilter(
+        field_name='author_id',
+        lookup_expr='in',
+        coerce=int,
         label='Автор'
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = TagsFilter(label='Тэги')
+    search = filters.CharFilter(method='filter_search', label='Поиск')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(method='filter_is_in_shopping_cart')
+    ordering = filters.ChoiceFilter(
+        choices=ORDERING_CHOICES,
+        method='filter_ordering',
+        label='Сортировка'
+    )
     
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'author', 'is_in_shopping_cart', 'tags')
+        fields = ('is_favorited', 'author', 'is_in_shopping_cart', 'tags',
+                  'search', 'ordering')
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def _filter_by_user(self, queryset, model):
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )))
     
     def filter_is_favorited(self, queryset, name, value):
         if value:
-            return queryset.filter(favorite__user=self.request.user)
+            return self._filter_by_user(queryset, Favorite)
         return queryset
     
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return self._filter_by_user(queryset, Basket)
+        return queryset
+
+    def filter_ordering(self, queryset, name, value):
+        if value == 'popular':
+            return queryset.order_by(*POPULAR_ORDERING)
         return queryset
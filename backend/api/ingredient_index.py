@@ -0,0 +1,69 @@
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipe.models import Ingredient
+
+from . import versions
+
+VERSION_KEY = 'ingredients:version'
+
+
+class IngredientIndex(versions.VersionedData):
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированные по имени ингредиенты в готовом для ответа
+    виде. Версия индекса лежит в кэше, поэтому сброс по сигналу
+    доходит до всех воркеров.
+    """
+
+    version_key = VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self._index = ([], [])
+
+    def _load(self, version):
+        items = list(Ingredient.objects.values(
+            'id', 'name', 'measurement_unit'
+        ).order_by('name', 'id'))
+        keyed = sorted(
+            ((item['name'].casefold(), item) for item in items),
+            key=lambda pair: pair[0]
+        )
+        self._index = (
+            [key for key, _ in keyed], [item for _, item in keyed]
+        )
+
+    def all(self):
+        self._ensure_loaded()
+        return self._index[1]
+
+    def search(self, name, limit=None):
+        """Сначала совпадения по началу названия, затем по подстроке"""
+        self._ensure_loaded()
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = name.strip().casefold()
+        keys, items = self._index
+        result = []
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            result.append(items[end])
+            if len(result) >= limit:
+                return result
+            end += 1
+        for position, key in enumerate(keys):
+            if start <= position < end or query not in key:
+                continue
+            result.append(items[position])
+            if len(result) >= limit:
+                break
+        return result
+
+
+def invalidate():
+    versions.invalidate(VERSION_KEY)
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,408 @@
+import base64
+import io
+import json
+import random
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import (ingredient_index, response_cache, shopping_cart,
+                 tag_registry)
+from recipe import counters, feed, search, similar
+from recipe.models import (Basket, Favorite, Ingredient, IngredientQuantity,
+                           Recipe, Tag)
+from users.models import Subscriber, User
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ч. л.', 'ст. л.', 'по вкусу')
+
+# Максимальное число SQL-запросов на один вызов эндпоинта
+# при размере страницы до 20 и 30 ингредиентах в рецепте.
+BUDGETS = {
+    'users-list': 4,
+    'users-list-anon': 4,
+    'users-me': 3,
+    'users-detail': 3,
+    'subscriptions': 4,
+    'subscribe': 10,
+    'unsubscribe': 4,
+    'ingredients-list': 2,
+    'ingredients-search': 2,
+    'tags-list': 2,
+    'tags-detail': 2,
+    'recipes-list': 8,
+    'recipes-list-anon': 7,
+    'recipes-list-cached-anon': 0,
+    'recipes-list-filtered': 7,
+    'recipes-list-cursor': 7,
+    'recipes-list-popular': 8,
+    'recipes-search': 8,
+    'recipes-cook': 8,
+    'recipes-similar': 2,
+    'recipes-recommended': 2,
+    'recipes-detail': 7,
+    'recipes-create': 14,
+    'recipes-update': 22,
+    'favorite': 12,
+    'unfavorite': 12,
+    'shopping-cart': 6,
+    'shopping-cart-delete': 6,
+    'favorite-bulk': 15,
+    'unfavorite-bulk': 15,
+    'shopping-cart-bulk': 8,
+    'shopping-cart-bulk-delete': 7,
+    'shopping-cart-clear': 6,
+    'download-shopping-cart': 3,
+    'feed': 5,
+}
+
+# Ожидаемый статус ответа, если он не 200
+STATUSES = {
+    'subscribe': 201,
+    'unsubscribe': 204,
+    'recipes-create': 201,
+    'favorite': 201,
+    'unfavorite': 204,
+    'shopping-cart': 201,
+    'shopping-cart-delete': 204,
+    'favorite-bulk': 201,
+    'unfavorite-bulk': 204,
+    'shopping-cart-bulk': 201,
+}
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), '#ffcc00').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+class Command(BaseCommand):
+    help = ('benchmark of SQL queries, time and response size '
+            'for every API endpoint on synthetic data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--per-recipe', type=int, default=8,
+                            help='ingredients per recipe')
+        parser.add_argument('--favorites', type=int, default=20000)
+        parser.add_argument('--baskets', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=10000)
+        parser.add_argument('--page-sizes', default='6,20',
+                            help='comma separated values of ?limit=')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path',
+                            help='write results to a JSON file')
+        parser.add_argument('--keep', action='store_true',
+                            help='keep synthetic data in the database')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        page_sizes = [
+            int(size) for size in options['page_sizes'].split(',') if size
+        ]
+        # Кэш общий с сайтом: после отката вернуть то, что посчитано
+        # по данным бенчмарка без таймаута
+        stop_ingredients = cache.get(similar.STOP_INGREDIENTS_KEY)
+        with tempfile.TemporaryDirectory() as media_root:
+            # Варианты изображений строятся в потоке запроса, иначе
+            # фоновый поток не увидит откатываемых данных
+            with override_settings(MEDIA_ROOT=media_root,
+                                   RECIPE_IMAGE_WORKERS=0):
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    self.seed(options)
+                    self.stdout.write(
+                        f'Данные созданы за '
+                        f'{time.perf_counter() - started:.1f} c'
+                    )
+                    results = self.run_endpoints(page_sizes)
+                    if not options['keep']:
+                        transaction.set_rollback(True)
+        self.invalidate_caches()
+        if not options['keep']:
+            self.restore_caches(stop_ingredients)
+        self.report(results)
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        failed = [
+            result for result in results
+            if result['queries'] > result['budget']
+            or result['status'] != result['expected_status']
+        ]
+        if failed:
+            raise CommandError(
+                'Превышен бюджет запросов или неверный статус: '
+                + ', '.join(
+                    f'{result["endpoint"]} (limit={result["limit"]}, '
+                    f'{result["queries"]}/{result["budget"]}, '
+                    f'status={result["status"]}/'
+                    f'{result["expected_status"]})'
+                    for result in failed
+                )
+            )
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены'))
+
+    @staticmethod
+    def invalidate_caches():
+        # bulk_create и откат транзакции не отправляют сигналы
+        ingredient_index.invalidate()
+        tag_registry.invalidate()
+        response_cache.invalidate()
+
+    @staticmethod
+    def restore_caches(stop_ingredients):
+        shopping_cart.invalidate_all()
+        cache.delete(feed.CELEBRITIES_KEY)
+        if stop_ingredients is None:
+            cache.delete(similar.STOP_INGREDIENTS_KEY)
+        else:
+            cache.set(similar.STOP_INGREDIENTS_KEY, stop_ingredients, None)
+
+    def seed(self, options):
+        rng = self.rng
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'bench{i}', color='#abcdef', slug=f'bench-{i}')
+            for i in range(10)
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench ингредиент {i}',
+                       measurement_unit=UNITS[i % len(UNITS)])
+            for i in range(options['ingredients'])
+        )
+        self.ingredient_ids = list(Ingredient.objects.filter(
+            name__startswith='bench ').values_list('id', flat=True))
+        User.objects.bulk_create(
+            User(username=f'bench{i}', email=f'bench{i}@bench.local',
+                 first_name='Bench', last_name=str(i), password='!')
+            for i in range(options['users'])
+        )
+        user_ids = list(User.objects.filter(
+            email__endswith='@bench.local').values_list('id', flat=True))
+        self.user = User.objects.get(id=user_ids[0])
+        self.token = Token.objects.create(user=self.user)
+
+        Recipe.objects.bulk_create(
+            Recipe(author_id=rng.choice(user_ids), name=f'bench {i}',
+                   text=f'bench recipe {i}', image='images/bench.png',
+                   cooking_time=rng.randint(1, 120))
+            for i in range(options['recipes'])
+        )
+        recipe_ids = list(Recipe.objects.filter(
+            name__startswith='bench ').values_list('id', flat=True))
+        search.update_search_vector(recipe_ids)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.id)
+            for recipe_id in recipe_ids
+            for tag in rng.sample(tags, rng.randint(1, 3))
+        )
+        per_recipe = min(options['per_recipe'], len(self.ingredient_ids))
+        IngredientQuantity.objects.bulk_create(
+            (IngredientQuantity(recipe_id=recipe_id, ingredient_id=item,
+                                amount=rng.randint(1, 500))
+             for recipe_id in recipe_ids
+             for item in rng.sample(self.ingredient_ids, per_recipe)),
+            batch_size=5000
+        )
+        for model, count in ((Favorite, options['favorites']),
+                             (Basket, options['baskets'])):
+            model.objects.bulk_create(
+                (model(user_id=rng.choice(user_ids),
+                       recipe_id=rng.choice(recipe_ids))
+                 for _ in range(count)),
+                batch_size=5000, ignore_conflicts=True
+            )
+        Subscriber.objects.bulk_create(
+            (Subscriber(user_id=user_id, author_id=author_id)
+             for user_id, author_id in (
+                (rng.choice(user_ids), rng.choice(user_ids))
+                for _ in range(options['subscriptions']))
+             if user_id != author_id),
+            batch_size=5000, ignore_conflicts=True
+        )
+        # Основной пользователь: подписки, корзина и избранное
+        authors = rng.sample(user_ids[1:], min(200, len(user_ids) - 1))
+        Subscriber.objects.bulk_create(
+            (Subscriber(user=self.user, author_id=author_id)
+             for author_id in authors),
+            ignore_conflicts=True
+        )
+        for author_id in authors:
+            feed.backfill(self.user.id, author_id)
+        for model in (Basket, Favorite):
+            model.objects.bulk_create(
+                (model(user=self.user, recipe_id=recipe_id)
+                 for recipe_id in rng.sample(recipe_ids,
+                                             min(100, len(recipe_ids)))),
+                ignore_conflicts=True
+            )
+        subscribed = set(Subscriber.objects.filter(
+            user=self.user).values_list('author_id', flat=True))
+        self.free_authors = [
+            user_id for user_id in user_ids[1:] if user_id not in subscribed
+        ]
+        self.free_recipes = list(Recipe.objects.filter(
+            id__in=recipe_ids
+        ).exclude(favorite__user=self.user).exclude(
+            shopping_cart__user=self.user
+        ).values_list('id', flat=True)[:100])
+        # Корзины чужих пользователей: их очищает shopping-cart-clear
+        self.clear_users = list(User.objects.filter(
+            id__in=Basket.objects.exclude(user=self.user).values('user_id')
+        ))
+        self.tag_ids = [tag.id for tag in tags]
+        self.tag_slugs = [tag.slug for tag in tags]
+        counters.reconcile()
+        similar.build()
+        self.invalidate_caches()
+
+    def recipe_payload(self, name):
+        return {
+            'name': name,
+            'text': f'{name} text',
+            'cooking_time': 10,
+            'image': make_image(),
+            'tags': self.tag_ids[:3],
+            'ingredients': [
+                {'id': ingredient_id, 'amount': self.rng.randint(1, 500)}
+                for ingredient_id in self.rng.sample(self.ingredient_ids,
+                                                     30)
+            ],
+        }
+
+    def endpoints(self, limit):
+        recipe_id = self.free_recipes.pop()
+        bulk_ids = {'recipes': [self.free_recipes.pop() for _ in range(5)]}
+        author_id = self.free_authors.pop()
+        return [
+            ('users-list', 'get', f'/api/users/?limit={limit}', None),
+            ('users-list-anon', 'get', f'/api/users/?limit={limit}', None),
+            ('users-me', 'get', '/api/users/me/', None),
+            ('users-detail', 'get', f'/api/users/{author_id}/', None),
+            ('subscriptions', 'get',
+             f'/api/users/subscriptions/?limit={limit}&recipes_limit=3',
+             None),
+            ('subscribe', 'post', f'/api/users/{author_id}/subscribe/',
+             None),
+            ('unsubscribe', 'delete', f'/api/users/{author_id}/subscribe/',
+             None),
+            ('ingredients-list', 'get', '/api/ingredients/', None),
+            ('ingredients-search', 'get', '/api/ingredients/?name=bench',
+             None),
+            ('tags-list', 'get', '/api/tags/', None),
+            ('tags-detail', 'get', f'/api/tags/{self.tag_ids[0]}/', None),
+            ('recipes-list', 'get', f'/api/recipes/?limit={limit}', None),
+            ('recipes-list-anon', 'get', f'/api/recipes/?limit={limit}',
+             None),
+            ('recipes-list-cached-anon', 'get',
+             f'/api/recipes/?limit={limit}', None),
+            ('recipes-list-filtered', 'get',
+             f'/api/recipes/?limit={limit}&is_favorited=1'
+             f'&tags={self.tag_slugs[0]}&tags={self.tag_slugs[1]}', None),
+            ('recipes-list-popular', 'get',
+             f'/api/recipes/?limit={limit}&ordering=popular', None),
+            ('recipes-search', 'get',
+             f'/api/recipes/?limit={limit}&search=bench+recipe+1', None),
+            ('recipes-cook', 'get',
+             f'/api/recipes/cook/?limit={limit}&' + '&'.join(
+                 f'ingredients={ingredient_id}'
+                 for ingredient_id in self.ingredient_ids[:20]
+             ), None),
+            ('recipes-similar', 'get',
+             f'/api/recipes/{recipe_id}/similar/', None),
+            ('recipes-recommended', 'get', '/api/recipes/recommended/', None),
+            ('recipes-list-cursor', 'get',
+             f'/api/recipes/?limit={limit}&cursor=', None),
+            ('recipes-detail', 'get', f'/api/recipes/{recipe_id}/', None),
+            ('recipes-create', 'post', '/api/recipes/',
+             self.recipe_payload(f'bench new {limit}')),
+            ('recipes-update', 'patch', '/api/recipes/{created}/',
+             self.recipe_payload(f'bench updated {limit}')),
+            ('favorite', 'post', f'/api/recipes/{recipe_id}/favorite/',
+             None),
+            ('unfavorite', 'delete', f'/api/recipes/{recipe_id}/favorite/',
+             None),
+            ('shopping-cart', 'post',
+             f'/api/recipes/{recipe_id}/shopping_cart/', None),
+            ('shopping-cart-delete', 'delete',
+             f'/api/recipes/{recipe_id}/shopping_cart/', None),
+            ('favorite-bulk', 'post', '/api/recipes/favorite/', bulk_ids),
+            ('unfavorite-bulk', 'delete', '/api/recipes/favorite/',
+             bulk_ids),
+            ('shopping-cart-bulk', 'post', '/api/recipes/shopping_cart/',
+             bulk_ids),
+            ('shopping-cart-bulk-delete', 'delete',
+             '/api/recipes/shopping_cart/', bulk_ids),
+            ('download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/', None),
+            ('shopping-cart-clear', 'delete',
+             '/api/recipes/shopping_cart/clear/', None),
+            ('feed', 'get', f'/api/recipes/feed/?limit={limit}', None),
+        ]
+
+    def run_endpoints(self, page_sizes):
+        authorized = APIClient()
+        authorized.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        anonymous = APIClient()
+        results = []
+        for limit in page_sizes:
+            created = None
+            for name, method, url, data in self.endpoints(limit):
+                client = anonymous if name.endswith('-anon') else authorized
+                if name == 'shopping-cart-clear':
+                    client = APIClient()
+                    client.force_authenticate(self.clear_users.pop())
+                url = url.format(created=created)
+                # Данные откатываются, поэтому on_commit выполняется
+                # вручную, а его запросы входят в бюджет
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    with TestCase.captureOnCommitCallbacks(execute=True):
+                        response = getattr(client, method)(
+                            url, data, format='json')
+                    elapsed = time.perf_counter() - started
+                    size = len(b''.join(response)) if response.streaming \
+                        else len(response.content)
+                if name == 'recipes-create' and response.status_code == 201:
+                    created = response.json()['id']
+                results.append({
+                    'endpoint': name,
+                    'method': method.upper(),
+                    'url': url,
+                    'limit': limit,
+                    'status': response.status_code,
+                    'expected_status': STATUSES.get(name, 200),
+                    'queries': len(queries),
+                    'budget': BUDGETS[name],
+                    'ms': round(elapsed * 1000, 1),
+                    'bytes': size,
+                })
+        return results
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"endpoint":26} {"limit":>5} {"status":>6} {"queries":>7} '
+            f'{"budget":>6} {"ms":>8} {"bytes":>9}'
+        )
+        for result in results:
+            line = (
+                f'{result["endpoint"]:26} {result["limit"]:>5} '
+                f'{result["status"]:>6} {result["queries"]:>7} '
+                f'{result["budget"]:>6} {result["ms"]:>8} '
+                f'{result["bytes"]:>9}'
+            )
+            if (result['queries'] > result['budget']
+                    or result['status'] != result['expected_status']):
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
@@ -1,13 +1,194 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """Число строк по оценке планировщика PostgreSQL"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def cached_count(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = 'count:' + hashlib.md5(
+        f'{queryset.db}:{sql}:{params}'.encode()
+    ).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_TIMEOUT)
+    return count
+
+
+class CountPaginator(Paginator):
+    """Paginator с точным, кэшированным или оценочным count.
+
+    Режим задаётся настройкой PAGINATION_COUNT: exact, cached
+    или estimate (вне PostgreSQL работает как cached).
+    """
+
+    @cached_property
+    def count(self):
+        mode = settings.PAGINATION_COUNT
+        if mode == 'estimate':
+            count = estimate_count(self.object_list)
+            if count is not None:
+                return count
+            mode = 'cached'
+        if mode == 'cached':
+            return cached_count(self.object_list)
+        return super().count
+
+
+class KeysetPagination(CursorPagination):
+    """Keyset-пагинация по полям ordering без OFFSET и COUNT.
+
+    Курсор хранит значения полей последней записи страницы,
+    следующая страница выбирается условием «после этих значений».
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 20
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        self.has_next = len(results) > self.page_size
+        return self.page
+
+    def get_position_filter(self, position):
+        """(a, b) после (x, y): a > x или a = x и b > y"""
+        query = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            query |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return query
+
+    def get_ordering_fields(self, queryset):
+        """Поля модели или аннотации, по которым идёт сортировка"""
+        fields = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if name in queryset.query.annotations:
+                fields.append(queryset.query.annotations[name].output_field)
+            else:
+                fields.append(queryset.model._meta.get_field(name))
+        return fields
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(
+                encoded.encode('ascii')
+            ))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        # Значения из курсора не должны ронять запрос с 500
+        try:
+            position = [
+                field.to_python(value) for field, value
+                in zip(self.get_ordering_fields(queryset), position)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, obj):
+        position = [
+            getattr(obj, field.lstrip('-')) for field in self.ordering
+        ]
+        # str() сохраняет микросекунды даты, в отличие от DjangoJSONEncoder
+        encoded = urlsafe_b64encode(json.dumps(
+            position, default=str
+        ).encode()).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_link(self):
+        return None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        ]))
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """Постраничная пагинация; с параметром cursor — keyset"""
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 20
+    django_paginator_class = CountPaginator
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
 
 
 class NoPagination(PageNumberPagination):
     page_size = None
     page_size_query_param = None
-    max_page_size = None
\ No newline at end of file
+    max_page_size = None
+
+
+class FeedCursorPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+
+from recipe import counters, similar
+from recipe.models import Basket, Favorite, Recipe
+
+from . import shopping_cart
+
+
+def _changed(model, user_id, recipe_ids):
+    """То же, что делают сигналы Basket и Favorite.
+
+    bulk_create и удаление одним DELETE сигналов не отправляют.
+    """
+    if model is Basket:
+        transaction.on_commit(
+            lambda: shopping_cart.invalidate_users([user_id])
+        )
+    if model is Favorite and recipe_ids and settings.SIMILAR_INCREMENTAL:
+        transaction.on_commit(
+            lambda: similar.favorites_changed(user_id, recipe_ids)
+        )
+
+
+def get_recipes(model, user, recipe_ids):
+    """Рецепты из recipe_ids с пометкой present — уже в списке user"""
+    return list(Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).defer('search_vector').annotate(
+        present=Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+    ).order_by('id'))
+
+
+def add(model, user, recipes, **fields):
+    """Добавить рецепты в избранное или корзину.
+
+    INSERT ... ON CONFLICT DO NOTHING: повторный запрос или двойной
+    клик не падает на уникальном ограничении. Счётчики пересчитываются
+    по данным под блокировкой строк рецептов.
+    fields (порции в корзине) записываются и в уже добавленные строки
+    через ON CONFLICT DO UPDATE.
+    Возвращает True, если добавлен хотя бы один рецепт.
+    """
+    new_ids = [recipe.id for recipe in recipes if not recipe.present]
+    recipe_ids = [recipe.id for recipe in recipes] if fields else new_ids
+    if not recipe_ids:
+        return False
+    rows = [
+        model(user=user, recipe_id=recipe_id, **fields)
+        for recipe_id in recipe_ids
+    ]
+    with transaction.atomic():
+        if new_ids:
+            counters.lock(new_ids)
+        if fields:
+            model.objects.bulk_create(
+                rows, update_conflicts=True,
+                unique_fields=('user', 'recipe'), update_fields=tuple(fields)
+            )
+        else:
+            model.objects.bulk_create(rows, ignore_conflicts=True)
+        if new_ids:
+            counters.refresh(model, new_ids)
+    _changed(model, user.id, new_ids)
+    return bool(new_ids)
+
+
+def remove(model, user, recipe_ids):
+    """Убрать рецепты из избранного или корзины одним DELETE.
+
+    Возвращает число удалённых строк.
+    """
+    using = model.objects.db
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with transaction.atomic(using=using):
+        counters.lock(recipe_ids)
+        # QuerySet.delete() при подписанных сигналах сначала выбирает строки
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {model._meta.db_table} '
+                f'WHERE user_id = %s AND recipe_id IN ({placeholders})',
+                [user.id, *recipe_ids]
+            )
+            deleted = cursor.rowcount
+        if deleted:
+            counters.refresh(model, recipe_ids)
+    if deleted:
+        _changed(model, user.id, recipe_ids)
+    return deleted
+
+
+def clear(model, user):
+    """Очистить избранное или корзину пользователя.
+
+    Удаляются только прочитанные строки: рецепт, добавленный
+    параллельным запросом, останется, а счётчики не разойдутся.
+    """
+    recipe_ids = list(model.objects.filter(
+        user=user
+    ).values_list('recipe_id', flat=True))
+    if not recipe_ids:
+        return 0
+    return remove(model, user, recipe_ids)
@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу отдаёт записанную строку"""
+    def write(self, value):
+        return value
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый renderer списка покупок.
+
+    stream() принимает итератор строк агрегата с ключами
+    name, measurement_unit и amount
+    и отдаёт файл по частям для StreamingHttpResponse.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Используется только для ответов с ошибками
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+
+class TextShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        yield 'Cписок покупок:\n\nНазвание продукта - Кол-во/Ед.изм.\n'
+        for row in rows:
+            yield (
+                f'{row["name"]} - {row["amount"]}/'
+                f'{row["measurement_unit"]} \n'
+            )
+
+
+class CSVShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'amount', 'measurement_unit'))
+        for row in rows:
+            yield writer.writerow((
+                row['name'],
+                row['amount'],
+                row['measurement_unit'],
+            ))
+
+
+class JSONShoppingCartRenderer(ShoppingCartRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = '['
+        for row in rows:
+            yield separator + json.dumps({
+                'name': row['name'],
+                'amount': row['amount'],
+                'measurement_unit': row['measurement_unit'],
+            }, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+
+class PDFShoppingCartRenderer(ShoppingCartRenderer):
+    """PDF собирается целиком: reportlab пишет файл только в save()"""
+    media_type = 'application/pdf'
+    format = 'pdf'
+    font_name = 'ShoppingCartFont'
+    font_size = 12
+    line_height = 18
+    margin = 50
+
+    def register_font(self):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_CART_PDF_FONT)
+            )
+        return self.font_name
+
+    def stream(self, rows):
+        font = self.register_font()
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        width, height = A4
+        y = height - self.margin
+        pdf.setFont(font, self.font_size + 4)
+        pdf.drawString(self.margin, y, 'Список покупок')
+        y -= self.line_height * 2
+        pdf.setFont(font, self.font_size)
+        for row in rows:
+            if y < self.margin:
+                pdf.showPage()
+                pdf.setFont(font, self.font_size)
+                y = height - self.margin
+            pdf.drawString(
+                self.margin, y,
+                f'• {row["name"]} - {row["amount"]} '
+                f'{row["measurement_unit"]}'
+            )
+            y -= self.line_height
+        pdf.save()
+        yield buffer.getvalue()
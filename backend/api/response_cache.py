@@ -0,0 +1,85 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import versions
+
+VERSION_KEY = 'responses:version'
+
+
+def invalidate():
+    versions.invalidate(VERSION_KEY)
+
+
+def cache_key(name, params):
+    """Ключ ответа: версия, действие и отсортированные параметры"""
+    normalized = '&'.join(
+        f'{param}={value}'
+        for param, values in sorted(params.items())
+        for value in sorted(values)
+    )
+    digest = hashlib.md5(normalized.encode()).hexdigest()
+    return f'responses:{versions.get_version(VERSION_KEY)}:{name}:{digest}'
+
+
+class AnonymousCacheMixin:
+    """Кэш ответов list и retrieve для анонимных пользователей.
+
+    Для анонима флаги избранного, корзины и подписки всегда False,
+    поэтому ответ зависит только от параметров из cache_params.
+    Кэшируются данные до рендеринга, формат ответа не важен.
+    В режиме ANONYMOUS_CACHE_STALE устаревший ответ отдаётся,
+    пока один запрос пересчитывает его.
+
+    Добавление в избранное и корзину кэш не сбрасывает: иначе он
+    сбрасывался бы почти на каждый запрос. Счётчики favorites_count
+    и in_basket_count и порядок ordering=popular в кэше отстают
+    не больше чем на ANONYMOUS_CACHE_TIMEOUT.
+    """
+    cache_params = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            'list', super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            'retrieve', super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, action, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        params = {
+            param: request.query_params.getlist(param)
+            for param in self.cache_params
+            if param in request.query_params
+        }
+        # Ссылки next и previous в ответе абсолютные
+        name = (
+            f'{request.get_host()}:{self.basename}:{action}:'
+            f'{kwargs.get("pk", "")}'
+        )
+        key = cache_key(name, params)
+        entry = cache.get(key)
+        if entry is not None:
+            data, fresh_until = entry
+            if time.time() < fresh_until or not cache.add(
+                    f'{key}:refresh', True,
+                    settings.ANONYMOUS_CACHE_REFRESH_TIMEOUT):
+                return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            timeout = settings.ANONYMOUS_CACHE_TIMEOUT
+            stale = settings.ANONYMOUS_CACHE_STALE_TIMEOUT \
+                if settings.ANONYMOUS_CACHE_STALE else 0
+            cache.set(
+                key, (response.data, time.time() + timeout), timeout + stale
+            )
+            cache.delete(f'{key}:refresh')
+        return response
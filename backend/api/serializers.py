@@ -1,10 +1,15 @@
-from drf_extra_fields.fields import Base64ImageField
+from recipe.images import schedule_variants, variant_urls
 from recipe.models import (Basket, Favorite, Ingredient, IngredientQuantity,
                            Recipe, Tag)
 from rest_framework import serializers
 from users.serializers import CustomUserSerializer
+from django.conf import settings
 from django.db import transaction
 
+from . import shopping_cart
+from .fields import RecipeImageField
+from .tag_registry import tag_registry
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Serializer для ингедиентов"""
@@ -38,22 +43,33 @@ class TagSerializer(serializers.ModelSerializer):
 
 class RecipeListSerializer(serializers.ModelSerializer):
     """Serializer списка рецептов"""
-    tags = TagSerializer(many=True, read_only=True)
+    tags = serializers.SerializerMethodField(read_only=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = serializers.SerializerMethodField(read_only=True)
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
+    def get_tags(self, obj):
+        return tag_registry.get_many(tag.id for tag in obj.tags.all())
 
     def get_ingredients(self, obj):
         return IngredientQuantitySerializer(obj.recipe.all(), many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
         return Favorite.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
@@ -62,13 +78,28 @@ class RecipeListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time', 'pub_date')
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time', 'pub_date', 'favorites_count',
+                  'in_basket_count')
+
+
+class CookRecipeSerializer(RecipeListSerializer):
+    """Serializer рецептов, подобранных по ингредиентам"""
+    coverage = serializers.FloatField(read_only=True)
+    missing_count = serializers.SerializerMethodField(read_only=True)
+
+    def get_missing_count(self, obj):
+        return obj.ingredients_count - obj.matched_count
+
+    class Meta(RecipeListSerializer.Meta):
+        fields = RecipeListSerializer.Meta.fields + (
+            'coverage', 'missing_count'
+        )
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
     """Вспомогательный сериализатор рецептов"""
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -78,11 +109,10 @@ class AddIngredientSerializer(serializers.ModelSerializer):
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer для рецептов"""
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = AddIngredientSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     def validate(self, data):
         ingredients = data.get('ingredients')
@@ -90,44 +120,84 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 'ingredients': 'Необходимо выбрать хотя бы 1 ингредиент'
             })
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient.get('id')
-            if not ingredient_id:
-                raise serializers.ValidationError({
-                    'id': 'Необходимо выбрать хотя бы 1 ингредиент'
-                })
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError({
-                    'ingredients': 'Все ингредиенты должны быть уникальными'
-                })
-            ingredients_list.append(ingredient_id)
-        tags = data.get('tags')
-        if not tags:
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError({
+                'ingredients': 'Все ингредиенты должны быть уникальными'
+            })
+        tag_ids = data.get('tags')
+        if not tag_ids:
             raise serializers.ValidationError({
                 'tags': 'Необходимо выбрать хотя бы 1 тэг'
             })
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise serializers.ValidationError({
-                    'tags': 'Тэги должны быть уникальными'
-                })
-            tags_list.append(tag)
+        if len(set(tag_ids)) != len(tag_ids):
+            raise serializers.ValidationError({
+                'tags': 'Тэги должны быть уникальными'
+            })
+        errors = {}
+        found_ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        missing = set(ingredient_ids) - set(found_ingredients)
+        if missing:
+            errors['ingredients'] = [
+                'Ингредиенты не найдены: '
+                + ', '.join(map(str, sorted(missing)))
+            ]
+        found_tags = {tag['id'] for tag in tag_registry.get_many(tag_ids)}
+        missing = set(tag_ids) - found_tags
+        if missing:
+            errors['tags'] = [
+                'Тэги не найдены: ' + ', '.join(map(str, sorted(missing)))
+            ]
+        if errors:
+            raise serializers.ValidationError(errors)
+        for ingredient in ingredients:
+            ingredient['id'] = found_ingredients[ingredient['id']]
         return data
 
     @staticmethod
     def _create_ingredients(ingredients, recipe):
-        for ingredient in ingredients:
-            IngredientQuantity.objects.create(
+        IngredientQuantity.objects.bulk_create(
+            IngredientQuantity(
                 recipe=recipe, ingredient=ingredient['id'],
                 amount=ingredient['amount']
             )
+            for ingredient in ingredients
+        )
+
+    @staticmethod
+    def _update_ingredients(ingredients, recipe):
+        """Изменить только добавленные, удалённые и изменённые строки"""
+        existing = {
+            item.ingredient_id: item
+            for item in IngredientQuantity.objects.filter(recipe=recipe)
+        }
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            IngredientQuantity.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            IngredientQuantity.objects.bulk_update(changed, ['amount'])
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['id'].id not in existing
+        ]
+        if added:
+            RecipeSerializer._create_ingredients(added, recipe)
 
     @staticmethod
     def create_tags(tags, recipe):
-        for tag in tags:
-            recipe.tags.add(tag)
+        recipe.tags.add(*tags)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -136,23 +206,47 @@ class RecipeSerializer(serializers.ModelSerializer):
         if not tags:
             return KeyError('отсутствует тэг')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(author=author, **validated_data)
+        recipe = Recipe.objects.create(
+            author=author, ingredients_count=len(ingredients),
+            **validated_data
+        )
         self.create_tags(tags, recipe)
         self._create_ingredients(ingredients, recipe)
+        schedule_variants(recipe)
         return recipe
 
+    def save(self, **kwargs):
+        instance = super().save(**kwargs)
+        image = self.validated_data.get('image')
+        if image is not None:
+            # Временный файл загрузки уже перенесён в хранилище
+            image.close()
+        return instance
+
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.with_relations(request.user).get(
+            pk=instance.pk
+        )
         return RecipeListSerializer(instance, context=context).data
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        IngredientQuantity.objects.filter(recipe=instance).delete()
-        self.create_tags(validated_data.pop('tags'), instance)
-        self._create_ingredients(validated_data.pop('ingredients'), instance)
-        return super().update(instance, validated_data)
+        instance.tags.set(validated_data.pop('tags'))
+        ingredients = validated_data.pop('ingredients')
+        self._update_ingredients(ingredients, instance)
+        validated_data['ingredients_count'] = len(ingredients)
+        # bulk-операции не отправляют сигналы, сбрасываем кэш списков покупок
+        transaction.on_commit(
+            lambda: shopping_cart.invalidate_recipes([instance.id])
+        )
+        if 'image' in validated_data:
+            validated_data['image_variants'] = {}
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_variants(instance)
+        return instance
 
     class Meta:
         model = Recipe
@@ -162,43 +256,43 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField(read_only=True)
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
-class BasketSerializer(serializers.ModelSerializer):
-    """Serializer для корзины"""
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления и удаления"""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_LISTS_BULK_MAX,
+    )
 
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return ShortRecipeSerializer(
-            instance.recipe, context=context).data
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
 
-    class Meta:
-        model = Basket
-        fields = ('user', 'recipe')
 
+class ServingsSerializer(serializers.Serializer):
+    """Число порций рецепта в корзине"""
+    servings = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.BASKET_MAX_SERVINGS,
+        required=False,
+    )
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Serializer для избранных рецептов"""
 
-    def validate(self, data):
-        request = self.context.get('request')
-        recipe = data['recipe']
-        if Favorite.objects.filter(user=request.user, recipe=recipe).exists():
-            raise serializers.ValidationError({
-                'status': 'рецепт уже есть в избранном'
-            })
-        return data
+class BasketRecipeIdsSerializer(RecipeIdsSerializer, ServingsSerializer):
+    """Рецепты для корзины с общим числом порций"""
 
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return ShortRecipeSerializer(
-            instance.recipe, context=context).data
 
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
+class ShoppingListItemSerializer(serializers.Serializer):
+    """Строка агрегированного списка покупок"""
+    name = serializers.CharField()
+    amount = serializers.IntegerField()
+    measurement_unit = serializers.CharField()
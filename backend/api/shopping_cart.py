@@ -0,0 +1,115 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (BigIntegerField, F, OuterRef, Subquery, Sum,
+                              Value)
+from django.db.models.functions import Cast, Coalesce
+
+from recipe.models import Basket, IngredientQuantity, UnitConversion
+
+GLOBAL_VERSION_KEY = 'shopping_cart:version'
+USER_VERSION_KEY = 'shopping_cart:version:user:{user_id}'
+RECIPE_VERSION_KEY = 'shopping_cart:version:recipe:{recipe_id}'
+RECIPES_KEY = 'shopping_cart:recipes:{user_id}:{version}'
+DATA_KEY = 'shopping_cart:list:{user_id}:{version}'
+
+
+def _get_versions(keys):
+    versions = cache.get_many(keys)
+    missing = {
+        key: uuid.uuid4().hex for key in keys if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _get_recipe_ids(user_id, user_version):
+    key = RECIPES_KEY.format(user_id=user_id, version=user_version)
+    recipe_ids = cache.get(key)
+    if recipe_ids is None:
+        recipe_ids = sorted(Basket.objects.filter(
+            user_id=user_id
+        ).values_list('recipe_id', flat=True))
+        cache.set(key, recipe_ids, settings.SHOPPING_CART_CACHE_TIMEOUT)
+    return recipe_ids
+
+
+def get_version(user_id):
+    """Версия списка покупок пользователя, она же ETag.
+
+    Складывается из глобальной версии, версии корзины пользователя
+    и версий всех рецептов в ней, поэтому изменение ингредиентов
+    рецепта сбрасывает списки без запроса к БД.
+    """
+    global_version, user_version = _get_versions([
+        GLOBAL_VERSION_KEY, USER_VERSION_KEY.format(user_id=user_id)
+    ])
+    recipe_versions = _get_versions([
+        RECIPE_VERSION_KEY.format(recipe_id=recipe_id)
+        for recipe_id in _get_recipe_ids(user_id, user_version)
+    ])
+    return hashlib.md5('-'.join(
+        [global_version, user_version, *recipe_versions]
+    ).encode()).hexdigest()
+
+
+def invalidate_users(user_ids):
+    cache.delete_many([
+        USER_VERSION_KEY.format(user_id=user_id) for user_id in user_ids
+    ])
+
+
+def invalidate_recipes(recipe_ids):
+    cache.delete_many([
+        RECIPE_VERSION_KEY.format(recipe_id=recipe_id)
+        for recipe_id in recipe_ids
+    ])
+
+
+def invalidate_all():
+    cache.delete(GLOBAL_VERSION_KEY)
+
+
+def get_ingredients(user):
+    """Список покупок одним агрегирующим запросом.
+
+    Количества умножаются на число порций рецепта в корзине,
+    совместимые единицы переводятся в базовые по UnitConversion.
+    """
+    conversion = UnitConversion.objects.filter(
+        unit=OuterRef('ingredient__measurement_unit')
+    )
+    factor = Coalesce(Subquery(conversion.values('factor')), Value(1))
+    return IngredientQuantity.objects.filter(
+        recipe__shopping_cart__user=user
+    ).values(
+        name=F('ingredient__name'),
+        measurement_unit=Coalesce(
+            Subquery(conversion.values('base_unit')),
+            F('ingredient__measurement_unit')
+        ),
+    ).order_by('name', 'measurement_unit').annotate(amount=Cast(Sum(
+        # smallint * smallint переполняется в PostgreSQL, а sum(bigint)
+        # возвращает numeric — считаем в bigint и его же возвращаем
+        Cast('amount', BigIntegerField())
+        * F('recipe__shopping_cart__servings') * factor
+    ), BigIntegerField()))
+
+
+def iter_shopping_cart(user, version):
+    """Строки списка покупок из кэша или из БД с сохранением в кэш"""
+    key = DATA_KEY.format(user_id=user.id, version=version)
+    rows = cache.get(key)
+    if rows is not None:
+        yield from rows
+        return
+    rows = []
+    for row in get_ingredients(user).iterator(
+            chunk_size=settings.SHOPPING_CART_CHUNK_SIZE):
+        rows.append(row)
+        yield row
+    cache.set(key, rows, settings.SHOPPING_CART_CACHE_TIMEOUT)
@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipe import feed, search, similar
+from recipe.models import (Basket, Favorite, Ingredient, IngredientQuantity,
+                           Recipe, Tag, UnitConversion)
+from users.models import Subscriber, User
+
+from . import (ingredient_index, response_cache, shopping_cart,
+               tag_registry)
+
+
+@receiver((post_save, post_delete), sender=Basket)
+def basket_changed(sender, instance, **kwargs):
+    # После коммита, иначе параллельная выгрузка закэширует
+    # старый список под новой версией
+    user_id = instance.user_id
+    transaction.on_commit(lambda: shopping_cart.invalidate_users([user_id]))
+
+
+@receiver((post_save, post_delete), sender=IngredientQuantity)
+def ingredient_quantity_changed(sender, instance, **kwargs):
+    recipe_id = instance.recipe_id
+    transaction.on_commit(
+        lambda: shopping_cart.invalidate_recipes([recipe_id])
+    )
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    # После коммита, чтобы индекс и списки не собрались из старых данных
+    transaction.on_commit(shopping_cart.invalidate_all)
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete), sender=UnitConversion)
+def unit_conversion_changed(sender, instance, **kwargs):
+    transaction.on_commit(shopping_cart.invalidate_all)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    # После коммита, иначе параллельный запрос закэширует старые тэги
+    # под новой версией
+    transaction.on_commit(tag_registry.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    if kwargs.get('created') is False or not settings.SIMILAR_INCREMENTAL:
+        return
+    user_id, recipe_id = instance.user_id, instance.recipe_id
+    transaction.on_commit(
+        lambda: similar.favorites_changed(user_id, [recipe_id])
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, update_fields, **kwargs):
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        search.update_search_vector([instance.pk])
+
+
+@receiver(post_save, sender=Subscriber)
+def subscribed(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscriber)
+def unsubscribed(sender, instance, **kwargs):
+    feed.prune(instance.user_id, instance.author_id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientQuantity)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=User)
+def public_data_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields == {'last_login'}:
+        return
+    # После коммита, чтобы в кэш не попали данные до изменения
+    transaction.on_commit(response_cache.invalidate)
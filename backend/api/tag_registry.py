@@ -0,0 +1,79 @@
+import json
+
+from django.core.cache import cache
+
+from recipe.models import Tag
+
+from . import versions
+
+VERSION_KEY = 'tags:version'
+DATA_KEY = 'tags:data:{version}'
+FIELDS = ('id', 'name', 'color', 'slug')
+
+
+class TagRegistry(versions.VersionedData):
+    """Тэги в памяти процесса в готовом для ответа виде.
+
+    Таблица тэгов маленькая и почти не меняется. Версия и JSON тэгов
+    лежат в кэше: сброс по сигналу доходит до всех воркеров, а из базы
+    тэги читает только первый воркер, заметивший новую версию.
+    """
+
+    version_key = VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self._items = []
+        self._by_id = {}
+        self._by_slug = {}
+        self._json = b'[]'
+
+    def _load(self, version):
+        key = DATA_KEY.format(version=version)
+        payload = cache.get(key)
+        if payload is None:
+            # Формат совпадает с ответом JSONRenderer
+            payload = json.dumps(
+                list(Tag.objects.values(*FIELDS).order_by('id')),
+                ensure_ascii=False, separators=(',', ':')
+            )
+            cache.set(key, payload, None)
+        self._items = json.loads(payload)
+        self._by_id = {item['id']: item for item in self._items}
+        self._by_slug = {item['slug']: item['id'] for item in self._items}
+        self._json = payload.encode()
+
+    def all(self):
+        self._ensure_loaded()
+        return self._items
+
+    def json(self):
+        """Список тэгов, уже сериализованный в JSON"""
+        self._ensure_loaded()
+        return self._json
+
+    def get(self, tag_id):
+        self._ensure_loaded()
+        return self._by_id.get(tag_id)
+
+    def get_many(self, tag_ids):
+        """Тэги по id в порядке запроса; неизвестные id пропускаются"""
+        self._ensure_loaded()
+        return [
+            self._by_id[tag_id] for tag_id in tag_ids
+            if tag_id in self._by_id
+        ]
+
+    def ids_for_slugs(self, slugs):
+        """id известных тэгов; неизвестные slug пропускаются"""
+        self._ensure_loaded()
+        return {
+            self._by_slug[slug] for slug in slugs if slug in self._by_slug
+        }
+
+
+def invalidate():
+    versions.invalidate(VERSION_KEY)
+
+
+tag_registry = TagRegistry()
@@ -0,0 +1,44 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Версия из кэша Django; если её нет — создаётся новая.
+
+    cache.add не перезаписывает версию, которую успел создать
+    другой воркер.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(key):
+    cache.delete(key)
+
+
+class VersionedData:
+    """Данные в памяти процесса, которые перечитываются при смене версии.
+
+    Наследник задаёт version_key и _load(version).
+    """
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+
+    def _load(self, version):
+        raise NotImplementedError
+
+    def _ensure_loaded(self):
+        version = get_version(self.version_key)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._load(version)
+                    self._version = version
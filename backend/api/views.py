@@ -1,36 +1,67 @@
+import os
+
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import (Http404, HttpResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils.http import parse_etags, quote_etag
 
-from recipe.models import (Basket, Favorite, Ingredient, IngredientQuantity,
-                           Recipe, Tag)
+from recipe.models import Basket, Favorite, Ingredient, Recipe, Tag
 from rest_framework import viewsets
 
 from .serializers import (IngredientSerializer, TagSerializer,
-                          RecipeListSerializer, RecipeSerializer, BasketSerializer,
-                          FavoriteSerializer)
+                          RecipeListSerializer, RecipeSerializer,
+                          RecipeIdsSerializer, BasketRecipeIdsSerializer,
+                          ServingsSerializer, CookRecipeSerializer,
+                          ShortRecipeSerializer, ShoppingListItemSerializer)
 from .permissions import  AuthorOrReadOnly
-from .pagination import CustomPageNumberPagination, NoPagination
-from .filters import IngredientSearchFilter, RecipeFilter
+from .pagination import (CustomPageNumberPagination, FeedCursorPagination,
+                         NoPagination)
+from . import recipe_lists, shopping_cart
+from .ingredient_index import ingredient_index
+from .response_cache import AnonymousCacheMixin
+from .tag_registry import tag_registry
+from .filters import (POPULAR_ORDERING, SEARCH_ORDERING,
+                      IngredientSearchFilter, RecipeFilter)
+from .renderers import (CSVShoppingCartRenderer, JSONShoppingCartRenderer,
+                        PDFShoppingCartRenderer, TextShoppingCartRenderer)
 from foodgram.settings import FILENAME
+from recipe import similar as similar_recipes
+from recipe.feed import get_feed
 
-
-
+SHOPPING_CART_RENDERERS = [
+    TextShoppingCartRenderer,
+    CSVShoppingCartRenderer,
+    JSONShoppingCartRenderer,
+    PDFShoppingCartRenderer,
+]
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
-    """View представления ингредиентов"""
+    """View представления ингредиентов.
+
+    Список и поиск отдаёт индекс в памяти процесса, кэш ответов
+    для анонимов им не нужен.
+    """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [IngredientSearchFilter]
     search_fields = ('^name',)
     pagination_class = NoPagination
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientSearchFilter.search_param)
+        if not name:
+            return Response(ingredient_index.all())
+        return Response(ingredient_index.search(name))
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """View представления тэгов"""
@@ -39,81 +70,288 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     pagination_class = NoPagination
 
+    def list(self, request, *args, **kwargs):
+        if isinstance(request.accepted_renderer, JSONRenderer):
+            return HttpResponse(
+                tag_registry.json(), content_type='application/json'
+            )
+        return Response(tag_registry.all())
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            tag = tag_registry.get(int(kwargs['pk']))
+        except ValueError:
+            tag = None
+        if tag is None:
+            raise Http404
+        return Response(tag)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
     """View представления рецептов"""
     queryset = Recipe.objects.all()
     permission_classes = [AuthorOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     pagination_class = CustomPageNumberPagination
+    cache_params = tuple(RecipeFilter.base_filters) + (
+        'page', 'limit', 'cursor'
+    )
+
+    @property
+    def keyset_ordering(self):
+        params = self.request.query_params
+        if self.action == 'cook':
+            return ('-coverage', '-id')
+        # search и ordering применяет только фильтр списка рецептов
+        if self.action != 'list':
+            return ('-pub_date', '-id')
+        if params.get('ordering') == 'popular':
+            return POPULAR_ORDERING
+        if params.get('search', '').strip():
+            return SEARCH_ORDERING
+        return ('-pub_date', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return queryset.with_relations(self.request.user)
+        return queryset
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeListSerializer
         return RecipeSerializer
     
-    def _post_method_actions(self, request, pk, serializers):
-        data = {'user': request.user.id, 'recipe': pk}
-        serializer = serializers(data=data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-    
-    def _delete_method_actions(self, request, pk, model):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        model_object = get_object_or_404(model, user=user, recipe=recipe)
-        model_object.delete()
+    @staticmethod
+    def _recipe_pk(pk):
+        """pk из URL числом: нечисловой pk — 404, а не 500"""
+        try:
+            return int(pk)
+        except ValueError:
+            raise Http404
+
+    def _add_recipe(self, request, pk, model, **fields):
+        recipes = recipe_lists.get_recipes(
+            model, request.user, [self._recipe_pk(pk)]
+        )
+        if not recipes:
+            raise Http404
+        created = recipe_lists.add(model, request.user, recipes, **fields)
+        serializer = ShortRecipeSerializer(
+            recipes[0], context=self.get_serializer_context()
+        )
+        # Повторное добавление не ошибка: рецепт уже в списке
+        return Response(
+            serializer.data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+
+    def _remove_recipe(self, request, pk, model):
+        recipe = get_object_or_404(
+            Recipe.objects.only('id'), id=self._recipe_pk(pk)
+        )
+        recipe_lists.remove(model, request.user, [recipe.id])
         return Response(status=status.HTTP_204_NO_CONTENT)
-    
+
+    def _recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def _add_recipes(self, request, model,
+                     serializer_class=RecipeIdsSerializer):
+        serializer = serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        fields = dict(serializer.validated_data)
+        recipe_ids = fields.pop('recipes')
+        recipes = recipe_lists.get_recipes(model, request.user, recipe_ids)
+        missing = set(recipe_ids) - {recipe.id for recipe in recipes}
+        if missing:
+            raise ValidationError({'recipes': [
+                'Рецепты не найдены: '
+                + ', '.join(map(str, sorted(missing)))
+            ]})
+        created = recipe_lists.add(model, request.user, recipes, **fields)
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        status_code = (
+            status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+        return serializer.data, status_code
+
+    def _shopping_list(self, request):
+        """Агрегат корзины; заодно кэширует его для download"""
+        version = shopping_cart.get_version(request.user.id)
+        return ShoppingListItemSerializer(
+            shopping_cart.iter_shopping_cart(request.user, version),
+            many=True
+        ).data
+
     @action(detail=True, methods=["POST"],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk):
-        return self._post_method_actions(
-            request=request, pk=pk, serializers=FavoriteSerializer
-        )
+        return self._add_recipe(request=request, pk=pk, model=Favorite)
 
     @favorite.mapping.delete
     def delete_favorite(self, request, pk):
-        return self._delete_method_actions(
-            request=request, pk=pk, model=Favorite
-        )
-    
+        return self._remove_recipe(request=request, pk=pk, model=Favorite)
+
+    @action(detail=False, methods=["POST"], url_path='favorite',
+            url_name='favorite-bulk', permission_classes=[IsAuthenticated])
+    def favorite_bulk(self, request):
+        data, status_code = self._add_recipes(request=request, model=Favorite)
+        return Response(data, status=status_code)
+
+    @favorite_bulk.mapping.delete
+    def delete_favorite_bulk(self, request):
+        recipe_lists.remove(Favorite, request.user, self._recipe_ids(request))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=True, methods=["POST"],
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk):
-        return self._post_method_actions(
-            request=request, pk=pk, serializers=BasketSerializer
+        serializer = ServingsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self._add_recipe(
+            request=request, pk=pk, model=Basket, **serializer.validated_data
         )
 
     @shopping_cart.mapping.delete
     def delete_shoping_cart(self, request, pk):
-        return self._delete_method_actions(
-            request=request, pk=pk, model=Basket
+        return self._remove_recipe(request=request, pk=pk, model=Basket)
+
+    @action(detail=False, methods=["POST"], url_path='shopping_cart',
+            url_name='shopping_cart-bulk',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_bulk(self, request):
+        """Добавить рецепты в корзину, в ответе — новый список покупок"""
+        data, status_code = self._add_recipes(
+            request=request, model=Basket,
+            serializer_class=BasketRecipeIdsSerializer
         )
-    
+        return Response({
+            'recipes': data,
+            'shopping_list': self._shopping_list(request),
+        }, status=status_code)
+
+    @shopping_cart_bulk.mapping.delete
+    def delete_shopping_cart_bulk(self, request):
+        recipe_lists.remove(Basket, request.user, self._recipe_ids(request))
+        return Response({'shopping_list': self._shopping_list(request)})
+
+    @action(detail=False, methods=["DELETE"],
+            url_path='shopping_cart/clear', url_name='shopping_cart-clear',
+            permission_classes=[IsAuthenticated])
+    def clear_shopping_cart(self, request):
+        recipe_lists.clear(Basket, request.user)
+        return Response({'shopping_list': []})
+
+    @action(detail=False, methods=["GET"],
+            permission_classes=[IsAuthenticated],
+            pagination_class=FeedCursorPagination)
+    def feed(self, request):
+        queryset = get_feed(request.user).with_relations(request.user)
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeListSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def _similar_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit'))
+        except (TypeError, ValueError):
+            return settings.SIMILAR_RECIPES_TOP_K
+        return max(1, min(limit, settings.SIMILAR_RECIPES_TOP_K))
+
+    @action(detail=True, methods=["GET"], pagination_class=None)
+    def similar(self, request, pk):
+        """Похожие рецепты из заранее посчитанной таблицы соседей"""
+        pk = self._recipe_pk(pk)
+        recipes = list(similar_recipes.get_similar(
+            pk, self._similar_limit(request)
+        ))
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["GET"], pagination_class=None,
+            permission_classes=[IsAuthenticated])
+    def recommended(self, request):
+        """Рекомендации по соседям рецептов из избранного"""
+        recipes = similar_recipes.get_recommended(
+            request.user, self._similar_limit(request)
+        )
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=["GET"])
+    def cook(self, request):
+        """Что приготовить: рецепты по доле имеющихся ингредиентов"""
+        try:
+            ingredient_ids = {
+                int(value) for value in request.query_params.getlist(
+                    'ingredients'
+                )
+            }
+        except ValueError:
+            raise ValidationError({
+                'ingredients': 'id ингредиентов должны быть числами'
+            })
+        if not ingredient_ids:
+            raise ValidationError({
+                'ingredients': 'Укажите хотя бы 1 ингредиент'
+            })
+        if len(ingredient_ids) > settings.COOK_MAX_INGREDIENTS:
+            raise ValidationError({
+                'ingredients': f'Не больше {settings.COOK_MAX_INGREDIENTS} '
+                               f'ингредиентов'
+            })
+        full = request.query_params.get('full') in ('1', 'true', 'True')
+        queryset = Recipe.objects.cookable(
+            ingredient_ids, full=full
+        ).with_relations(request.user)
+        page = self.paginate_queryset(queryset)
+        serializer = CookRecipeSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=False,
         methods=["GET"],
         url_path='download_shopping_cart',
         url_name='download_shopping_cart',
         pagination_class=None,
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_CART_RENDERERS
     )
     def download_basket(self, request):
-        ingredients = IngredientQuantity.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).order_by('ingredient__name').annotate(total=Sum('amount'))
-        result = 'Cписок покупок:\n\nНазвание продукта - Кол-во/Ед.изм.\n'
-        for ingredient in ingredients:
-            result += ''.join([
-                f'{ingredient["ingredient__name"]} - {ingredient["total"]}/'
-                f'{ingredient["ingredient__measurement_unit"]} \n'
-            ])
-        response = HttpResponse(result, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={FILENAME}'
+        renderer = request.accepted_renderer
+        version = shopping_cart.get_version(request.user.id)
+        etag = quote_etag(f'{version}-{renderer.format}')
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = StreamingHttpResponse(
+                renderer.stream(
+                    shopping_cart.iter_shopping_cart(request.user, version)
+                ),
+                content_type=(
+                    f'{renderer.media_type}; charset={renderer.charset}'
+                )
+            )
+            filename = f'{os.path.splitext(FILENAME)[0]}.{renderer.format}'
+            response['Content-Disposition'] = (
+                f'attachment; filename={filename}'
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
         return response
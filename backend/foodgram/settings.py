@@ -101,6 +101,17 @@ else:
     }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -145,13 +156,21 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6
 }
 
 
+# Кэш токенов: размер LRU в процессе, TTL и общий уровень в CACHES
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TIMEOUT = 60
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED') == 'True'
+
+# id авторов из подписок пользователя для флагов is_subscribed
+SUBSCRIPTIONS_CACHE_TIMEOUT = 60 * 60
+
 DJOSER = {
     "LOGIN_FIELD": 'email',
     "SEND_ACTIVATION_EMAIL": False,
@@ -167,7 +186,66 @@ DJOSER = {
     },
 }
 
+INGREDIENT_SEARCH_LIMIT = 50
+
+RECIPE_SEARCH_CONFIG = 'russian'
+RECIPE_SEARCH_TRIGRAM_THRESHOLD = 0.3
+# Поиск без PostgreSQL: сколько лучших рецептов возвращать
+RECIPE_SEARCH_FALLBACK_LIMIT = 1000
+
+# Сколько ингредиентов можно передать в /api/recipes/cook/
+COOK_MAX_INGREDIENTS = 100
+
+# Сколько рецептов можно передать в массовое добавление в избранное и корзину
+RECIPE_LISTS_BULK_MAX = 100
+# Максимум порций одного рецепта в корзине
+BASKET_MAX_SERVINGS = 50
+
+SIMILAR_RECIPES_TOP_K = 20
+SIMILAR_FAVORITES_WEIGHT = 0.6
+SIMILAR_INGREDIENTS_WEIGHT = 0.4
+SIMILAR_MAX_USER_FAVORITES = 500
+SIMILAR_MAX_INGREDIENT_RECIPES = 1000
+# Кандидатов на точную оценку: top_k * SIMILAR_CANDIDATES_FACTOR
+SIMILAR_CANDIDATES_FACTOR = 5
+# Обновлять соседей при добавлении и удалении избранного
+SIMILAR_INCREMENTAL = os.getenv('SIMILAR_INCREMENTAL', 'True') == 'True'
+
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (240, 240),
+    'card': (640, 480),
+    'full': (1600, 1600),
+}
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_TRACE_MEMORY = os.getenv('RECIPE_IMAGE_TRACE_MEMORY') == 'True'
+# JSON с изображением в base64 на треть больше самого изображения
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 1024 * 1024
+
+# Кэш ответов анонимным пользователям; избранное и корзины его
+# не сбрасывают, их счётчики в ответе отстают не больше чем на TIMEOUT
+ANONYMOUS_CACHE_TIMEOUT = 60
+# Отдавать устаревший ответ, пока один запрос его пересчитывает
+ANONYMOUS_CACHE_STALE = os.getenv('ANONYMOUS_CACHE_STALE') == 'True'
+ANONYMOUS_CACHE_STALE_TIMEOUT = 60 * 5
+ANONYMOUS_CACHE_REFRESH_TIMEOUT = 30
+
+# exact, cached или estimate (оценка планировщика PostgreSQL)
+PAGINATION_COUNT = os.getenv('PAGINATION_COUNT', 'exact')
+PAGINATION_COUNT_TIMEOUT = 60
+
+FEED_FANOUT_LIMIT = 5000
+FEED_BACKFILL_SIZE = 100
+FEED_CELEBRITIES_TIMEOUT = 60 * 5
+
 FILENAME = 'shopping_cart.txt'
+SHOPPING_CART_CHUNK_SIZE = 500
+SHOPPING_CART_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
 
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
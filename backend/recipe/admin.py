@@ -1,8 +1,9 @@
 from django.contrib import admin
 from django.contrib.admin import display
 
+from . import counters
 from .models import (Ingredient, Recipe, Tag, IngredientQuantity,
-                    Basket, Favorite)
+                    Basket, Favorite, UnitConversion)
 
 
 class IngredientAmountInline(admin.TabularInline):
@@ -37,9 +38,14 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     inlines = [IngredientAmountInline]
 
-    @display(description='Количество в избранных')
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        counters.reconcile(Recipe.objects.filter(pk=form.instance.pk))
+
+    @display(description='Количество в избранных',
+             ordering='favorites_count')
     def added_in_favorites(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
 
 
 @admin.register(Tag)
@@ -65,12 +71,26 @@ class IngredientQuantityAdmin(admin.ModelAdmin):
         'recipe',
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        counters.reconcile(Recipe.objects.filter(pk=obj.recipe_id))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        counters.reconcile(Recipe.objects.filter(pk=obj.recipe_id))
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        counters.reconcile(Recipe.objects.filter(pk__in=recipe_ids))
+
 
 @admin.register(Basket)
 class BasketAdmin(admin.ModelAdmin):
     list_display = (
         'user',
         'recipe',
+        'servings',
     )
     list_filter = (
         'user',
@@ -85,4 +105,13 @@ class FavoriteAdmin(admin.ModelAdmin):
     )
     list_filter = (
         'user',
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(UnitConversion)
+class UnitConversionAdmin(admin.ModelAdmin):
+    list_display = (
+        'unit',
+        'base_unit',
+        'factor',
+    )
@@ -0,0 +1,66 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Basket, Favorite, IngredientQuantity, Recipe
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    Basket: 'in_basket_count',
+    IngredientQuantity: 'ingredients_count',
+}
+
+
+def actual_count(model):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            count=Count('id')
+        ).values('count')
+    ), Value(0))
+
+
+def lock(recipe_ids):
+    """Заблокировать строки рецептов до конца транзакции.
+
+    Вызывается до вставки или удаления строк, которые считает
+    refresh: параллельная транзакция ждёт блокировку, и её пересчёт
+    в READ COMMITTED уже видит закоммиченные строки первой.
+    """
+    list(Recipe.objects.select_for_update().filter(
+        pk__in=recipe_ids
+    ).order_by('pk').values_list('pk', flat=True))
+
+
+def refresh(model, recipe_ids):
+    """Пересчитать счётчик рецептов по данным одним UPDATE.
+
+    Вызывать в транзакции после lock(recipe_ids).
+    """
+    field = COUNTERS[model]
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        **{field: actual_count(model)}
+    )
+
+
+def reconcile(queryset=None, dry_run=False):
+    """Пересчитать счётчики, разошедшиеся с данными.
+
+    Возвращает число исправленных рецептов.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    actual = {
+        field: actual_count(model) for model, field in COUNTERS.items()
+    }
+    drifted = queryset.annotate(**{
+        f'actual_{field}': expression for field, expression in actual.items()
+    }).exclude(**{
+        field: F(f'actual_{field}') for field in actual
+    })
+    count = drifted.count()
+    if count and not dry_run:
+        Recipe.objects.filter(
+            pk__in=drifted.values('pk')
+        ).update(**actual)
+    return count
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+
+from users.models import Subscriber
+
+from .models import FeedItem, Recipe
+
+CELEBRITIES_KEY = 'feed:celebrities'
+
+
+def get_celebrities():
+    """Авторы, чьи рецепты не раскладываются по лентам при записи.
+
+    У них больше FEED_FANOUT_LIMIT подписчиков, их рецепты
+    добавляются в ленту при чтении.
+    """
+    celebrities = cache.get(CELEBRITIES_KEY)
+    if celebrities is None:
+        celebrities = frozenset(Subscriber.objects.values(
+            'author_id'
+        ).annotate(
+            followers=Count('id')
+        ).filter(
+            followers__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('author_id', flat=True))
+        cache.set(
+            CELEBRITIES_KEY, celebrities, settings.FEED_CELEBRITIES_TIMEOUT
+        )
+    return celebrities
+
+
+def _bulk_add(items):
+    FeedItem.objects.bulk_create(
+        items, batch_size=1000, ignore_conflicts=True
+    )
+
+
+def fan_out(recipe):
+    """Добавить новый рецепт в ленты подписчиков автора.
+
+    Рецепт «звезды» только помечается: его добавляет в ленты
+    get_feed, даже если автор потом перестанет быть «звездой».
+    """
+    if recipe.author_id in get_celebrities():
+        recipe.fanned_out = False
+        Recipe.objects.filter(pk=recipe.pk).update(fanned_out=False)
+        return
+    _bulk_add(
+        FeedItem(user_id=user_id, recipe=recipe)
+        for user_id in Subscriber.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True).iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту последние рецепты нового автора из подписок.
+
+    Не разложенные рецепты «звёзд» добавляет get_feed.
+    """
+    _bulk_add(
+        FeedItem(user_id=user_id, recipe_id=recipe_id)
+        for recipe_id in Recipe.objects.filter(
+            author_id=author_id, fanned_out=True
+        ).values_list('id', flat=True)[:settings.FEED_BACKFILL_SIZE]
+    )
+
+
+def prune(user_id, author_id):
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def get_feed(user):
+    """Рецепты ленты: разложенные при записи и не разложенные «звёзд»"""
+    return Recipe.objects.filter(
+        Q(id__in=FeedItem.objects.filter(user=user).values('recipe_id'))
+        | Q(fanned_out=False) & Q(Exists(
+            Subscriber.objects.filter(user=user, author=OuterRef('author'))
+        ))
+    )
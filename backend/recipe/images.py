@@ -0,0 +1,118 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from api import response_cache
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix='recipe-images'
+        )
+    return _executor
+
+
+def variant_name(name, variant, extension):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(
+        directory, 'variants', f'{stem}_{variant}.{extension}'
+    )
+
+
+def build_variants(name):
+    """Сохранить уменьшенные копии изображения во всех форматах"""
+    with default_storage.open(name, 'rb') as f:
+        original = Image.open(f)
+        original.load()
+    original = ImageOps.exif_transpose(original).convert('RGB')
+    variants = {}
+    for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        variants[variant] = {}
+        for extension, image_format in FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, image_format,
+                       quality=settings.RECIPE_IMAGE_QUALITY, optimize=True)
+            path = variant_name(name, variant, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[variant][extension] = default_storage.save(
+                path, ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def process_recipe_image(recipe_id, name):
+    try:
+        variants = build_variants(name)
+        # Изображение могли заменить, пока шла обработка
+        updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_variants=variants
+        )
+        if updated:
+            # update() не отправляет сигналов
+            response_cache.invalidate()
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def _process_in_worker(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    finally:
+        # У каждого потока своё соединение с БД
+        connection.close()
+
+
+def schedule_variants(recipe):
+    """Построить варианты изображения после коммита транзакции"""
+    recipe_id, name = recipe.pk, recipe.image.name
+
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(_process_in_worker, recipe_id, name)
+        else:
+            process_recipe_image(recipe_id, name)
+
+    transaction.on_commit(submit)
+
+
+def variant_urls(recipe, request=None):
+    """URL вариантов изображения; до обработки — URL оригинала"""
+    if not recipe.image:
+        return None
+    variants = recipe.image_variants or {}
+    original = recipe.image.url
+    urls = {}
+    for variant in settings.RECIPE_IMAGE_VARIANTS:
+        urls[variant] = {}
+        for extension in FORMATS:
+            name = variants.get(variant, {}).get(extension)
+            url = default_storage.url(name) if name else original
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant][extension] = url
+    return urls
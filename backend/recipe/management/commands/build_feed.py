@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipe import feed
+from users.models import Subscriber
+
+
+class Command(BaseCommand):
+    help = 'filling subscription feeds from existing subscriptions'
+
+    def handle(self, *args, **options):
+        count = 0
+        for user_id, author_id in Subscriber.objects.values_list(
+                'user_id', 'author_id').iterator():
+            feed.backfill(user_id, author_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано подписок: {count}'
+        ))
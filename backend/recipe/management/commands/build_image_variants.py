@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipe.images import process_recipe_image
+from recipe.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'building thumbnail, card and full image variants of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='rebuild variants that already exist')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        count = 0
+        for recipe_id, name in recipes.values_list('id', 'image').iterator():
+            process_recipe_image(recipe_id, name)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {count}'
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipe import similar
+
+
+class Command(BaseCommand):
+    help = 'building similar recipes from favorites and ingredients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int,
+                            help='neighbours kept for every recipe')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        saved = similar.build(top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено пар похожих рецептов: {saved} '
+            f'({time.perf_counter() - started:.1f} c)'
+        ))
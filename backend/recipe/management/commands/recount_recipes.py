@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipe import counters
+
+
+class Command(BaseCommand):
+    help = 'recalculating favorite, shopping cart and ingredient counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='count drifted recipes without saving')
+
+    def handle(self, *args, **options):
+        count = counters.reconcile(dry_run=options['dry_run'])
+        message = f'Рецептов с неверными счётчиками: {count}'
+        if options['dry_run']:
+            message = 'Пробный запуск, изменения не сохранены. ' + message
+        self.stdout.write(self.style.SUCCESS(message))
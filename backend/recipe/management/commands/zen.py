@@ -1,11 +1,68 @@
 import csv
+import json
 import os
+import time
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api import ingredient_index, shopping_cart
 from recipe.models import Ingredient
 
+READ_SIZE = 64 * 1024
+
+
+def iter_csv(f):
+    for row in csv.reader(f):
+        if len(row) != 2:
+            yield None
+            continue
+        yield row
+
+
+def iter_json(f):
+    """Поэлементный разбор JSON-массива без загрузки файла в память"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip(', \n\r\t' if started else ' \n\r\t')
+        if not started and buffer:
+            if not buffer.startswith('['):
+                raise CommandError('Ожидается JSON-массив ингредиентов')
+            buffer = buffer[1:]
+            started = True
+            continue
+        if buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CommandError('Некорректный JSON')
+            else:
+                buffer = buffer[end:]
+                if isinstance(item, dict):
+                    yield [item.get('name'), item.get('measurement_unit')]
+                else:
+                    yield None
+                continue
+        if eof:
+            raise CommandError('Некорректный JSON')
+        chunk = f.read(READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+READERS = {
+    '.csv': iter_csv,
+    '.json': iter_json,
+}
+
 
 class Command(BaseCommand):
     help = 'loading ingredients from data in json or csv'
@@ -13,21 +70,93 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.csv', nargs='?',
                             type=str)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='count new ingredients without saving')
+        parser.add_argument('--update-units', action='store_true',
+                            help='update measurement unit of an existing '
+                                 'ingredient with the same name')
 
     def handle(self, *args, **options):
+        path = os.path.join(settings.BASE_DIR, 'data', options['filename'])
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        self.options = options
+        self.stats = dict.fromkeys(
+            ('rows', 'created', 'updated', 'skipped'), 0
+        )
+        started = time.perf_counter()
         try:
-            with open(os.path.join(
-                    settings.BASE_DIR,
-                    'data',
-                    options['filename']),
-                    'r',
-                    encoding='utf-8') as f:
-                data = csv.reader(f)
-                for row in data:
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=measurement_unit
-                    )
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = reader(f)
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+                    self.load_batch(batch)
+                    self.report(started)
         except FileNotFoundError:
-            raise CommandError('Добавьте файл ingredients в папку data')
\ No newline at end of file
+            raise CommandError('Добавьте файл ingredients в папку data')
+        if not options['dry_run'] and (
+                self.stats['created'] or self.stats['updated']):
+            # bulk_create и bulk_update не отправляют post_save
+            ingredient_index.invalidate()
+            shopping_cart.invalidate_all()
+        self.report(started, final=True)
+
+    def load_batch(self, batch):
+        self.stats['rows'] += len(batch)
+        pairs = {}
+        for row in batch:
+            # В JSON значения могут быть числами, null или пробелами
+            if row is None or not all(isinstance(value, str) for value in row):
+                self.stats['skipped'] += 1
+                continue
+            name, measurement_unit = (value.strip() for value in row)
+            if not name or not measurement_unit:
+                self.stats['skipped'] += 1
+                continue
+            pairs[(name, measurement_unit)] = None
+        existing = {}
+        for ingredient in Ingredient.objects.filter(
+                name__in={name for name, _ in pairs}):
+            existing.setdefault(ingredient.name, []).append(ingredient)
+        new = []
+        updated = []
+        for name, measurement_unit in pairs:
+            ingredients = existing.get(name, [])
+            if any(item.measurement_unit == measurement_unit
+                   for item in ingredients):
+                continue
+            if self.options['update_units'] and len(ingredients) == 1:
+                ingredients[0].measurement_unit = measurement_unit
+                updated.append(ingredients[0])
+                # Вторая новая единица того же названия — новая строка
+                del existing[name]
+                continue
+            new.append(Ingredient(
+                name=name, measurement_unit=measurement_unit
+            ))
+        self.stats['created'] += len(new)
+        self.stats['updated'] += len(updated)
+        if self.options['dry_run']:
+            return
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+            Ingredient.objects.bulk_update(updated, ['measurement_unit'])
+
+    def report(self, started, final=False):
+        elapsed = time.perf_counter() - started
+        rate = self.stats['rows'] / elapsed if elapsed else 0
+        message = (
+            '{rows} строк: создано {created}, обновлено {updated}, '
+            'пропущено {skipped}'.format(**self.stats)
+            + f' ({elapsed:.1f} c, {rate:.0f} строк/с)'
+        )
+        if final:
+            if self.options['dry_run']:
+                message = 'Пробный запуск, изменения не сохранены. ' + message
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(message, ending='\r')
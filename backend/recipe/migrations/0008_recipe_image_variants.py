@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 03:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0006_rename_colour_tag_color'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='варианты изображения'),
+        ),
+    ]
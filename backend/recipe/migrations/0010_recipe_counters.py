@@ -0,0 +1,49 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+
+    def actual_count(model_name):
+        model = apps.get_model('recipe', model_name)
+        return Coalesce(Subquery(
+            model.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                count=Count('id')
+            ).values('count')
+        ), Value(0))
+
+    Recipe.objects.update(
+        favorites_count=actual_count('Favorite'),
+        in_basket_count=actual_count('Basket'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0009_feeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_basket_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в корзинах покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
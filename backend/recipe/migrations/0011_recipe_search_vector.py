@@ -0,0 +1,53 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:03
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+CREATE_INDEXES = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+    'ON recipe_recipe USING gin (search_vector)',
+    'CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx '
+    'ON recipe_recipe USING gin (name gin_trgm_ops)',
+)
+DROP_INDEXES = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'DROP INDEX IF EXISTS recipe_name_trgm_idx',
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN-индексы и заполнение search_vector только для PostgreSQL"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_INDEXES:
+        schema_editor.execute(sql)
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Recipe.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector('text', weight='B', config='russian')
+    ))
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_INDEXES:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0010_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_ingredients_count(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+    IngredientQuantity = apps.get_model('recipe', 'IngredientQuantity')
+    Recipe.objects.update(ingredients_count=Coalesce(Subquery(
+        IngredientQuantity.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            count=Count('id')
+        ).values('count')
+    ), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0011_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='число ингредиентов'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientquantity',
+            index=models.Index(fields=['ingredient', 'recipe'], name='ingredient_recipe_idx'),
+        ),
+        migrations.RunPython(fill_ingredients_count, migrations.RunPython.noop),
+    ]
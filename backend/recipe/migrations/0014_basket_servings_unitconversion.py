@@ -0,0 +1,52 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:22
+
+import django.core.validators
+from django.db import migrations, models
+
+# Количества в списке покупок складываются в граммах, миллилитрах
+# и чайных ложках
+UNIT_CONVERSIONS = (
+    ('г', 'г', 1),
+    ('кг', 'г', 1000),
+    ('мл', 'мл', 1),
+    ('л', 'мл', 1000),
+    ('ч. л.', 'ч. л.', 1),
+    ('ст. л.', 'ч. л.', 3),
+)
+
+
+def fill_unit_conversions(apps, schema_editor):
+    UnitConversion = apps.get_model('recipe', 'UnitConversion')
+    UnitConversion.objects.bulk_create(
+        UnitConversion(unit=unit, base_unit=base_unit, factor=factor)
+        for unit, base_unit, factor in UNIT_CONVERSIONS
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0013_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitConversion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.CharField(max_length=20, unique=True, verbose_name='единица измерений')),
+                ('base_unit', models.CharField(max_length=20, verbose_name='базовая единица')),
+                ('factor', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='множитель')),
+            ],
+            options={
+                'verbose_name': 'Перевод единиц',
+                'verbose_name_plural': 'Перевод единиц',
+            },
+        ),
+        migrations.AddField(
+            model_name='basket',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1, message='Порций должно быть не меньше одной')], verbose_name='порций'),
+        ),
+        migrations.RunPython(fill_unit_conversions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.6 on 2026-10-18 04:33
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_not_fanned_out(apps, schema_editor):
+    """Рецепты нынешних «звёзд» по лентам не раскладывались"""
+    Recipe = apps.get_model('recipe', 'Recipe')
+    Subscriber = apps.get_model('users', 'Subscriber')
+    Recipe.objects.filter(author_id__in=Subscriber.objects.values(
+        'author_id'
+    ).annotate(
+        followers=Count('id')
+    ).filter(
+        followers__gt=settings.FEED_FANOUT_LIMIT
+    ).values('author_id')).update(fanned_out=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0014_basket_servings_unitconversion'),
+        ('users', '0005_user_is_active_user_is_admin_user_is_staff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fanned_out',
+            field=models.BooleanField(default=True, editable=False, verbose_name='разложен по лентам'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author'], name='recipe_not_fanned_out_idx'),
+        ),
+        migrations.RunPython(mark_not_fanned_out, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,9 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import (Count, Exists, F, FloatField, OuterRef,
+                              Prefetch, Subquery, Value)
+from django.db.models.functions import Cast, NullIf
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, RegexValidator
 
@@ -33,6 +37,67 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Queryset рецептов с подгрузкой связей для списков"""
+
+    def with_relations(self, user):
+        # is_subscribed авторов берётся из набора подписок запроса
+        return self.select_related('author').prefetch_related(
+            # Сами тэги отдаёт реестр, из базы нужны только id
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+            Prefetch(
+                'recipe',
+                queryset=IngredientQuantity.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        ).defer('search_vector').with_user_flags(user)
+
+    def cookable(self, ingredient_ids, full=False):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        coverage — доля ингредиентов рецепта из ingredient_ids,
+        при full остаются только рецепты, собранные целиком.
+        """
+        matched = IngredientQuantity.objects.filter(
+            ingredient_id__in=ingredient_ids
+        )
+        queryset = self.filter(
+            pk__in=matched.values('recipe_id')
+        ).annotate(
+            matched_count=Subquery(
+                matched.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().values('recipe').annotate(
+                    count=Count('id')
+                ).values('count')
+            ),
+        ).annotate(
+            coverage=Cast('matched_count', FloatField())
+            / NullIf('ingredients_count', 0),
+        )
+        if full:
+            queryset = queryset.filter(
+                matched_count__gte=F('ingredients_count')
+            )
+        return queryset.order_by('-coverage', '-id')
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(Basket.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+
 class Recipe(models.Model):
     """Модель рецептов"""
     author = models.ForeignKey(
@@ -52,6 +117,12 @@ class Recipe(models.Model):
         upload_to='images/',
         verbose_name='изображение',
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='варианты изображения',
+    )
     text = models.TextField(verbose_name='описание')
     tags = models.ManyToManyField(
         related_name='tags',
@@ -69,15 +140,49 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    ingredients_count = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='число ингредиентов',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='в избранном',
+    )
+    in_basket_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='в корзинах покупок',
+    )
+    # False — рецепт «звезды» не разложен по лентам при записи
+    # и добавляется в ленты подписчиков при чтении
+    fanned_out = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='разложен по лентам',
+    )
+    # Поддерживается сигналом, GIN-индекс создаёт миграция
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        constraints = [
-            models.UniqueConstraint(
-                fields=('name', 'text'),
-                name='unique_recipe'
+        indexes = [
+            models.Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=('author',),
+                condition=models.Q(fanned_out=False),
+                name='recipe_not_fanned_out_idx'
             )
         ]
 
@@ -121,6 +226,30 @@ class Tag(models.Model):
         return self.name
 
 
+class UnitConversion(models.Model):
+    """Перевод единицы измерения в базовую для списка покупок"""
+    unit = models.CharField(
+        max_length=20,
+        unique=True,
+        verbose_name='единица измерений',
+    )
+    base_unit = models.CharField(
+        max_length=20,
+        verbose_name='базовая единица',
+    )
+    factor = models.PositiveIntegerField(
+        verbose_name='множитель',
+        validators=[MinValueValidator(1)]
+    )
+
+    class Meta:
+        verbose_name = 'Перевод единиц'
+        verbose_name_plural = 'Перевод единиц'
+
+    def __str__(self):
+        return f'1 {self.unit} = {self.factor} {self.base_unit}'
+
+
 class IngredientQuantity(models.Model):
     recipe = models.ForeignKey(
         on_delete=models.CASCADE,
@@ -145,6 +274,13 @@ class IngredientQuantity(models.Model):
                 name='unique_ingredient_quantity'
             )
         ]
+        indexes = [
+            # Обратный индекс «ингредиент → рецепты» для подбора рецептов
+            models.Index(
+                fields=('ingredient', 'recipe'),
+                name='ingredient_recipe_idx'
+            )
+        ]
 
 
 class Basket(models.Model):
@@ -160,6 +296,13 @@ class Basket(models.Model):
         to='Recipe',
         verbose_name='рецепт',
     )
+    servings = models.PositiveSmallIntegerField(
+        default=1,
+        verbose_name='порций',
+        validators=[
+            MinValueValidator(1, message='Порций должно быть не меньше одной')
+        ]
+    )
 
     class Meta:
         constraints = [
@@ -201,3 +344,68 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в список избранных'
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок пользователя"""
+    user = models.ForeignKey(
+        on_delete=models.CASCADE,
+        related_name='feed',
+        to=User,
+        verbose_name='пользователь',
+    )
+    recipe = models.ForeignKey(
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        to='Recipe',
+        verbose_name='рецепт',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item'
+            )
+        ]
+        verbose_name = 'рецепт в ленте'
+        verbose_name_plural = 'лента подписок'
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Сосед рецепта по избранному и ингредиентам"""
+    recipe = models.ForeignKey(
+        on_delete=models.CASCADE,
+        related_name='similar',
+        to='Recipe',
+        verbose_name='рецепт',
+    )
+    similar = models.ForeignKey(
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        to='Recipe',
+        verbose_name='похожий рецепт',
+    )
+    score = models.FloatField(verbose_name='сходство')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('recipe', '-score'),
+                name='similar_recipe_score_idx'
+            )
+        ]
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'похожие рецепты'
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
@@ -0,0 +1,118 @@
+import difflib
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connections
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Recipe
+
+WORD = re.compile(r'\w+')
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def search_vector():
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector('text', weight='B', config=config)
+    )
+
+
+def update_search_vector(recipe_ids):
+    """Пересчитать search_vector; вне PostgreSQL ничего не делает"""
+    queryset = Recipe.objects.filter(pk__in=recipe_ids)
+    if is_postgresql(queryset):
+        queryset.update(search_vector=search_vector())
+
+
+def search(queryset, query):
+    """Рецепты по запросу, от лучших совпадений к худшим.
+
+    В PostgreSQL — полнотекстовый поиск по search_vector, а если он
+    ничего не нашёл — по триграммам названия (опечатки). В остальных
+    базах поиск идёт в Python. Оценка совпадения — в search_rank.
+    """
+    query = query.strip()
+    if not query:
+        return queryset
+    if not is_postgresql(queryset):
+        return python_search(queryset, query)
+    search_query = SearchQuery(
+        query, config=settings.RECIPE_SEARCH_CONFIG, search_type='websearch'
+    )
+    # ts_rank и similarity возвращают real; в double precision значение
+    # из курсора keyset-пагинации совпадает со значением в базе точно
+    ranked = queryset.filter(search_vector=search_query).annotate(
+        search_rank=Cast(
+            SearchRank(F('search_vector'), search_query), FloatField()
+        )
+    )
+    if ranked.exists():
+        return ranked.order_by('-search_rank', '-id')
+    return queryset.annotate(
+        search_rank=Cast(TrigramSimilarity('name', query), FloatField())
+    ).filter(
+        search_rank__gt=settings.RECIPE_SEARCH_TRIGRAM_THRESHOLD
+    ).order_by('-search_rank', '-id')
+
+
+def stem(word):
+    """Грубая основа слова: отбрасывает окончание у длинных слов"""
+    return word[:max(4, len(word) - 2)]
+
+
+def match(term, words):
+    """Доля совпадения term со словами текста: основа или опечатка"""
+    if any(word.startswith(term) for word in words):
+        return 1.0
+    close = difflib.get_close_matches(term, words, n=1, cutoff=0.75)
+    return 0.5 if close else 0.0
+
+
+def nothing_found(queryset):
+    return queryset.none().annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
+
+
+def python_search(queryset, query):
+    terms = [stem(word) for word in WORD.findall(query.casefold())]
+    if not terms:
+        return nothing_found(queryset)
+    scores = {}
+    for recipe_id, name, text in queryset.values_list(
+            'id', 'name', 'text').iterator():
+        name_words = set(WORD.findall(name.casefold()))
+        text_words = set(WORD.findall(text.casefold()))
+        score = 0.0
+        for term in terms:
+            found = max(NAME_WEIGHT * match(term, name_words),
+                        TEXT_WEIGHT * match(term, text_words))
+            if not found:
+                break
+            score += found
+        else:
+            scores[recipe_id] = score / len(terms)
+    best = sorted(
+        scores.items(), key=lambda item: (-item[1], -item[0])
+    )[:settings.RECIPE_SEARCH_FALLBACK_LIMIT]
+    if not best:
+        return nothing_found(queryset)
+    return queryset.filter(
+        pk__in=[recipe_id for recipe_id, _ in best]
+    ).annotate(
+        search_rank=Case(
+            *(When(pk=recipe_id, then=Value(score))
+              for recipe_id, score in best),
+            output_field=FloatField()
+        )
+    ).order_by('-search_rank', '-id')
@@ -0,0 +1,220 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .models import Favorite, IngredientQuantity, Recipe, SimilarRecipe
+
+STOP_INGREDIENTS_KEY = 'similar:stop_ingredients'
+
+
+def score(together, favorites_a, favorites_b,
+          shared, ingredients_a, ingredients_b):
+    """Сходство пары рецептов.
+
+    Взвешенная сумма косинусов: по пользователям, добавившим оба рецепта
+    в избранное, и по общим ингредиентам.
+    """
+    result = 0.0
+    if together and favorites_a and favorites_b:
+        result += settings.SIMILAR_FAVORITES_WEIGHT * together / math.sqrt(
+            favorites_a * favorites_b
+        )
+    if shared and ingredients_a and ingredients_b:
+        result += settings.SIMILAR_INGREDIENTS_WEIGHT * shared / math.sqrt(
+            ingredients_a * ingredients_b
+        )
+    return result
+
+
+def _load():
+    """Матрицы избранного и ингредиентов как списки смежности"""
+    favorites = defaultdict(list)
+    for user_id, recipe_id in Favorite.objects.values_list(
+            'user_id', 'recipe_id').iterator():
+        favorites[user_id].append(recipe_id)
+    favorites_count = Counter()
+    fans = defaultdict(list)
+    for user_id, recipe_ids in favorites.items():
+        favorites_count.update(recipe_ids)
+        # Пользователи с огромным избранным дают шум и квадратичную работу
+        if len(recipe_ids) > settings.SIMILAR_MAX_USER_FAVORITES:
+            continue
+        for recipe_id in recipe_ids:
+            fans[recipe_id].append(user_id)
+    ingredients = defaultdict(list)
+    postings = defaultdict(list)
+    for recipe_id, ingredient_id in IngredientQuantity.objects.values_list(
+            'recipe_id', 'ingredient_id').iterator():
+        ingredients[recipe_id].append(ingredient_id)
+        postings[ingredient_id].append(recipe_id)
+    # Соль и вода есть почти везде и ничего не говорят о сходстве
+    stop = frozenset(
+        ingredient_id for ingredient_id, recipe_ids in postings.items()
+        if len(recipe_ids) > settings.SIMILAR_MAX_INGREDIENT_RECIPES
+    )
+    return favorites, favorites_count, fans, ingredients, postings, stop
+
+
+def build(top_k=None, batch_size=5000):
+    """Пересобрать таблицу соседей: top_k лучших для каждого рецепта.
+
+    Строки матриц сходства считаются по одной: произведение разреженных
+    матриц через списки смежности, без полной матрицы в памяти.
+    Возвращает число сохранённых пар.
+    """
+    top_k = top_k or settings.SIMILAR_RECIPES_TOP_K
+    pool = top_k * settings.SIMILAR_CANDIDATES_FACTOR
+    favorites, favorites_count, fans, ingredients, postings, stop = _load()
+    saved = 0
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        batch = []
+        for recipe_id in Recipe.objects.values_list(
+                'id', flat=True).iterator():
+            together = Counter()
+            for user_id in fans[recipe_id]:
+                together.update(favorites[user_id])
+            shared = Counter()
+            for ingredient_id in ingredients[recipe_id]:
+                if ingredient_id not in stop:
+                    shared.update(postings[ingredient_id])
+            together.pop(recipe_id, None)
+            shared.pop(recipe_id, None)
+            # Точную оценку считаем только для лучших по числу совпадений
+            candidates = {
+                other_id
+                for counter in (together, shared)
+                for other_id, _ in counter.most_common(pool)
+            }
+            neighbours = heapq.nlargest(top_k, (
+                (score(
+                    together[other_id], favorites_count[recipe_id],
+                    favorites_count[other_id], shared[other_id],
+                    len(ingredients[recipe_id]), len(ingredients[other_id])
+                ), other_id)
+                for other_id in candidates
+            ))
+            batch.extend(
+                SimilarRecipe(
+                    recipe_id=recipe_id, similar_id=other_id, score=value
+                )
+                for value, other_id in neighbours if value
+            )
+            if len(batch) >= batch_size:
+                SimilarRecipe.objects.bulk_create(batch)
+                saved += len(batch)
+                batch = []
+        SimilarRecipe.objects.bulk_create(batch)
+        saved += len(batch)
+    cache.set(STOP_INGREDIENTS_KEY, stop, None)
+    return saved
+
+
+def update_pairs(recipe_ids, other_ids):
+    """Пересчитать сходство recipe_ids с other_ids в обе стороны.
+
+    Число запросов не зависит от числа рецептов. Лишние соседи
+    сверх top_k не удаляются: API берёт лучших, а лишнее убирает
+    очередная полная пересборка.
+    """
+    recipe_ids = set(recipe_ids)
+    other_ids = set(other_ids) | recipe_ids
+    if len(other_ids) < 2:
+        return
+    together = {
+        (recipe_id, other_id): count
+        for other_id, recipe_id, count in Favorite.objects.filter(
+            recipe_id__in=other_ids,
+            user__favorite__recipe_id__in=recipe_ids,
+        ).values('recipe_id', 'user__favorite__recipe_id').annotate(
+            count=Count('id')
+        ).values_list('recipe_id', 'user__favorite__recipe_id', 'count')
+    }
+    shared = {
+        (recipe_id, other_id): count
+        for other_id, recipe_id, count in IngredientQuantity.objects.filter(
+            recipe_id__in=other_ids,
+            ingredient__ingredient__recipe_id__in=recipe_ids,
+        ).exclude(
+            ingredient_id__in=cache.get(STOP_INGREDIENTS_KEY, ())
+        ).values('recipe_id', 'ingredient__ingredient__recipe_id').annotate(
+            count=Count('id')
+        ).values_list(
+            'recipe_id', 'ingredient__ingredient__recipe_id', 'count'
+        )
+    }
+    counts = {
+        pk: (favorites, ingredients)
+        for pk, favorites, ingredients in Recipe.objects.filter(
+            pk__in=other_ids
+        ).values_list('id', 'favorites_count', 'ingredients_count')
+    }
+    # Пара двух изменённых рецептов встречается дважды, ключ убирает дубли
+    rows = {}
+    unrelated = defaultdict(list)
+    for recipe_id in recipe_ids & counts.keys():
+        for other_id in other_ids & counts.keys() - {recipe_id}:
+            value = score(
+                together.get((recipe_id, other_id), 0),
+                counts[recipe_id][0], counts[other_id][0],
+                shared.get((recipe_id, other_id), 0),
+                counts[recipe_id][1], counts[other_id][1]
+            )
+            if not value:
+                unrelated[recipe_id].append(other_id)
+                continue
+            for pair in ((recipe_id, other_id), (other_id, recipe_id)):
+                rows[pair] = SimilarRecipe(
+                    recipe_id=pair[0], similar_id=pair[1], score=value
+                )
+    SimilarRecipe.objects.bulk_create(
+        rows.values(), update_conflicts=True,
+        unique_fields=('recipe', 'similar'), update_fields=('score',)
+    )
+    if unrelated:
+        condition = Q()
+        for recipe_id, ids in unrelated.items():
+            condition |= (
+                Q(recipe_id=recipe_id, similar_id__in=ids)
+                | Q(recipe_id__in=ids, similar_id=recipe_id)
+            )
+        SimilarRecipe.objects.filter(condition).delete()
+
+
+def favorites_changed(user_id, recipe_ids):
+    """Обновить пары рецептов с остальным избранным пользователя"""
+    other_ids = list(Favorite.objects.filter(
+        user_id=user_id
+    ).values_list('recipe_id', flat=True)[
+        :settings.SIMILAR_MAX_USER_FAVORITES + 1
+    ])
+    if len(other_ids) > settings.SIMILAR_MAX_USER_FAVORITES:
+        return
+    update_pairs(recipe_ids, other_ids)
+
+
+def get_similar(recipe_id, limit=None):
+    return Recipe.objects.filter(
+        similar_to__recipe_id=recipe_id
+    ).defer('search_vector').order_by(
+        '-similar_to__score', '-id'
+    )[:limit or settings.SIMILAR_RECIPES_TOP_K]
+
+
+def get_recommended(user, limit=None):
+    """Соседи избранного пользователя, которых в избранном ещё нет"""
+    favorites = Favorite.objects.filter(user=user).values('recipe_id')
+    return Recipe.objects.filter(
+        similar_to__recipe_id__in=favorites
+    ).exclude(
+        pk__in=favorites
+    ).defer('search_vector').annotate(
+        recommendation=Sum('similar_to__score')
+    ).order_by(
+        '-recommendation', '-id'
+    )[:limit or settings.SIMILAR_RECIPES_TOP_K]
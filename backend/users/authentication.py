@@ -0,0 +1,125 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from api import versions
+
+TOKEN_KEY = 'auth:token:{digest}'
+USER_VERSION_KEY = 'auth:user:{user_id}:version'
+
+
+def _digest(key):
+    # Сам токен в ключ кэша не попадает
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _user_version(user_id):
+    return versions.get_version(USER_VERSION_KEY.format(user_id=user_id))
+
+
+class TokenCache:
+    """LRU токенов в памяти процесса с TTL и общим уровнем в кэше Django.
+
+    Вместе с пользователем хранится его версия из кэша Django: сброс
+    версии при выходе или изменении пользователя доходит до всех
+    воркеров, если кэш общий; с локальным кэшем — не позже TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            user, token, version, expires = entry
+            if (time.monotonic() < expires
+                    and version == _user_version(user.pk)):
+                self.hits += 1
+                return user, token
+            self._discard(key)
+        if settings.TOKEN_CACHE_SHARED:
+            shared = cache.get(TOKEN_KEY.format(digest=_digest(key)))
+            if shared is not None:
+                user, token, version = shared
+                if version == _user_version(user.pk):
+                    self.shared_hits += 1
+                    self._store(key, user, token, version)
+                    return user, token
+        self.misses += 1
+        return None
+
+    def set(self, key, user, token):
+        version = _user_version(user.pk)
+        self._store(key, user, token, version)
+        if settings.TOKEN_CACHE_SHARED:
+            cache.set(
+                TOKEN_KEY.format(digest=_digest(key)),
+                (user, token, version), settings.TOKEN_CACHE_TIMEOUT
+            )
+
+    def _store(self, key, user, token, version):
+        expires = time.monotonic() + settings.TOKEN_CACHE_TIMEOUT
+        with self._lock:
+            self._entries[key] = (user, token, version, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def _discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_token(self, key):
+        self._discard(key)
+        cache.delete(TOKEN_KEY.format(digest=_digest(key)))
+
+    def invalidate_user(self, user_id):
+        versions.invalidate(USER_VERSION_KEY.format(user_id=user_id))
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if entry[0].pk == user_id]:
+                del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': settings.TOKEN_CACHE_SIZE,
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_ratio': round(
+                (self.hits + self.shared_hits) / lookups, 4
+            ) if lookups else None,
+        }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе на каждый вызов API"""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user, token)
+            cached = user, token
+        # Запросы не должны делить между собой один объект пользователя
+        user, token = (copy.copy(item) for item in cached)
+        token.user = user
+        return user, token
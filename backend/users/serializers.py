@@ -3,15 +3,22 @@ from djoser.serializers import (
     UserCreateSerializer, UserSerializer
 )
 
-from .models import User, Subscriber
+from .models import User
+from .subscriptions import followed_author_ids
+from recipe.images import variant_urls
 from recipe.models import Recipe
 
 
 class SmallRecipeSerializer(serializers.ModelSerializer):
     """Serializer рецептов"""
+    image_variants = serializers.SerializerMethodField(read_only=True)
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class CustomUserSerializer(UserSerializer):
@@ -29,10 +36,12 @@ class CustomUserSerializer(UserSerializer):
             'is_subscribed')
         
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
+        if request is None:
             return False
-        return Subscriber.objects.filter(user=user, author=obj.id).exists()
+        return obj.id in followed_author_ids(request)
 
 
 class SubscriberSerializer(CustomUserSerializer):
@@ -49,9 +58,13 @@ class SubscriberSerializer(CustomUserSerializer):
 
     @staticmethod
     def get_recipes_count(obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.author.count()
     
     def get_recipes(self, obj):
+        if hasattr(obj, 'latest_recipes'):
+            return SmallRecipeSerializer(obj.latest_recipes, many=True).data
         request = self.context.get('request')
         recipes = obj.author.all()
         recipes_limit = request.query_params.get('recipes_limit')
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import subscriptions
+from .authentication import token_cache
+from .models import Subscriber, User
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    key, user_id = instance.key, instance.user_id
+
+    def invalidate():
+        token_cache.invalidate_token(key)
+        token_cache.invalidate_user(user_id)
+
+    invalidate()
+    # И после коммита: до него параллельный запрос мог снова
+    # закэшировать ещё не удалённый токен
+    transaction.on_commit(invalidate)
+
+
+@receiver((post_save, post_delete), sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """Сбросить кэш токенов пользователя.
+
+    QuerySet.update() (например, User.objects.update(is_active=False))
+    сигналов не отправляет: такой пользователь остаётся в кэше
+    до TOKEN_CACHE_TIMEOUT, если не вызвать token_cache.invalidate_user.
+    """
+    if update_fields == {'last_login'}:
+        return
+    user_id = instance.pk
+    token_cache.invalidate_user(user_id)
+    transaction.on_commit(lambda: token_cache.invalidate_user(user_id))
+
+
+@receiver((post_save, post_delete), sender=Subscriber)
+def subscription_changed(sender, instance, **kwargs):
+    user_id = instance.user_id
+    subscriptions.invalidate(user_id)
+    # И после коммита: параллельный запрос мог закэшировать старый набор
+    transaction.on_commit(lambda: subscriptions.invalidate(user_id))
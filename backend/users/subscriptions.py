@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Subscriber
+
+CACHE_KEY = 'subscriptions:{user_id}'
+
+
+def followed_author_ids(request):
+    """id авторов из подписок пользователя запроса.
+
+    Загружаются один раз за запрос из кэша или одним запросом к базе,
+    после чего все флаги is_subscribed в ответе берутся из памяти.
+    """
+    user = request.user
+    if user.is_anonymous:
+        return frozenset()
+    author_ids = getattr(request, '_followed_author_ids', None)
+    if author_ids is None:
+        key = CACHE_KEY.format(user_id=user.id)
+        author_ids = cache.get(key)
+        if author_ids is None:
+            author_ids = frozenset(Subscriber.objects.filter(
+                user=user
+            ).values_list('author_id', flat=True))
+            cache.set(key, author_ids, settings.SUBSCRIPTIONS_CACHE_TIMEOUT)
+        request._followed_author_ids = author_ids
+    return author_ids
+
+
+def invalidate(user_id):
+    cache.delete(CACHE_KEY.format(user_id=user_id))
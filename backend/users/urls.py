@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (SubscribeListView, SubscribeViewSet, CustomUserViewSet)
+from .views import (SubscribeListView, SubscribeViewSet, CustomUserViewSet,
+                    TokenCacheStatsView)
 
 
 router = DefaultRouter()
@@ -24,5 +25,10 @@ urlpatterns = [
     path('users/', include(userpatterns)),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
+    path(
+        'auth/token/cache/',
+        TokenCacheStatsView.as_view(),
+        name='token_cache'
+    ),
     path('auth/', include('djoser.urls.authtoken')),
 ]
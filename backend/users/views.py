@@ -1,6 +1,8 @@
+from django.db.models import Count, Prefetch, Value
+from django.db.models.expressions import RawSQL
 from rest_framework import status
 from rest_framework.generics import ListAPIView, get_object_or_404
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 
 from rest_framework.response import Response
@@ -8,16 +10,34 @@ from rest_framework.views import APIView
 
 from djoser.views import UserViewSet
 
+from recipe.models import Recipe
+from .authentication import token_cache
 from .models import User, Subscriber
 from .serializers import SubscriberSerializer, CustomUserSerializer
 from api.pagination import CustomPageNumberPagination
 
 
+def latest_recipes_sql(user, limit):
+    """id последних limit рецептов каждого автора из подписок user"""
+    return RawSQL(
+        f'SELECT id FROM ('
+        f'SELECT id, ROW_NUMBER() OVER ('
+        f'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+        f') AS row_number FROM {Recipe._meta.db_table} '
+        f'WHERE author_id IN (SELECT author_id FROM '
+        f'{Subscriber._meta.db_table} WHERE user_id = %s)'
+        f') ranked WHERE row_number <= %s',
+        (user.id, limit)
+    )
+
+
 class CustomUserViewSet(UserViewSet):
     """Отображение кастомного юзера"""
-    queryset = User.objects.all()
+    queryset = User.objects.order_by('id')
     serializer_class = CustomUserSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = CustomPageNumberPagination
+    keyset_ordering = ('id',)
 
 
 class SubscribeListView(ListAPIView):
@@ -25,9 +45,29 @@ class SubscribeListView(ListAPIView):
     serializer_class = SubscriberSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPageNumberPagination
+    keyset_ordering = ('id',)
+
+    def get_recipes_limit(self):
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return recipes_limit if recipes_limit >= 0 else None
 
     def get_queryset(self):
-        return User.objects.filter(author_sub__user=self.request.user)
+        user = self.request.user
+        recipes = Recipe.objects.all()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(id__in=latest_recipes_sql(
+                user, recipes_limit
+            ))
+        return User.objects.filter(author_sub__user=user).annotate(
+            recipes_count=Count('author', distinct=True),
+            is_subscribed=Value(True),
+        ).prefetch_related(
+            Prefetch('author', queryset=recipes, to_attr='latest_recipes')
+        ).order_by('id')
 
 
 class SubscribeViewSet(APIView):
@@ -43,35 +83,32 @@ class SubscribeViewSet(APIView):
                 {'error': 'Нельзя подписаться самому на себя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if Subscriber.objects.filter(
-                user=request.user,
-                author_id=user_id
-        ).exists():
-            return Response(
-                {'error': 'Вы уже подписаны на данного пользователя'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
         author = get_object_or_404(User, id=user_id)
-        Subscriber.objects.create(
+        # get_or_create переживает гонку двух одинаковых запросов,
+        # повторная подписка возвращает 200 вместо ошибки
+        _, created = Subscriber.objects.get_or_create(
             user=request.user,
-            author_id=user_id
+            author=author
         )
         return Response(
             self.serializer_class(author, context={'request': request}).data,
-            status=status.HTTP_201_CREATED
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
         )
 
     def delete(self, request, *args, **kwargs):
         user_id = self.kwargs.get('user_id')
         get_object_or_404(User, id=user_id)
-        subscription = Subscriber.objects.filter(
+        # Отписка идемпотентна: 204 и когда подписки уже нет
+        Subscriber.objects.filter(
             user=request.user,
             author_id=user_id
-        )
-        if subscription:
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(
-            {'error': 'Вы не подписаны на данного пользователя'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        ).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TokenCacheStatsView(APIView):
+    """Счётчики кэша токенов текущего процесса"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(token_cache.stats())